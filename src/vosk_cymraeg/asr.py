@@ -0,0 +1,119 @@
+import io
+import json
+import os
+import queue
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Union
+
+from vosk import KaldiRecognizer, Model
+
+# The models are trained on 16kHz, mono channel, 16-bit PCM audio
+SAMPLE_RATE = 16_000
+
+# Number of frames passed to the recogniser at a time
+CHUNK_FRAMES = 8000
+
+Audio = Union[bytes, str, Path]
+
+
+class RecogniserPool:
+    """A fixed number of recognisers that share one model.
+
+    Recognisers are checked out by one thread at a time and reset when they are
+    returned, so the pool can be used from any number of threads. Vosk releases
+    the GIL while decoding, so a thread per recogniser is enough to use several
+    cores without loading more than one copy of the model.
+
+        pool = RecogniserPool("models/model", size=8)
+        text = pool.transcribe("clip.wav")
+    """
+
+    def __init__(
+        self,
+        model: Union[Model, str, Path],
+        size: Optional[int] = None,
+        sample_rate: int = SAMPLE_RATE,
+    ):
+        self.model = model if isinstance(model, Model) else Model(str(model))
+        self.size = size or os.cpu_count() or 1
+        self.sample_rate = sample_rate
+        self._idle: queue.LifoQueue[KaldiRecognizer] = queue.LifoQueue()
+        for _ in range(self.size):
+            self._idle.put(KaldiRecognizer(self.model, sample_rate))
+
+    def checkout(self, timeout: Optional[float] = None) -> KaldiRecognizer:
+        """Takes a recogniser out of the pool, waiting for one to be returned if
+        they are all in use. Raises TimeoutError if none is returned in time"""
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"No recogniser became available within {timeout} seconds"
+            ) from None
+
+    def checkin(self, recogniser: KaldiRecognizer) -> None:
+        """Resets the recogniser and puts it back into the pool"""
+        recogniser.Reset()
+        self._idle.put(recogniser)
+
+    @contextmanager
+    def recogniser(self, timeout: Optional[float] = None) -> Iterator[KaldiRecognizer]:
+        recogniser = self.checkout(timeout)
+        try:
+            yield recogniser
+        finally:
+            self.checkin(recogniser)
+
+    def transcribe(self, audio: Audio, timeout: Optional[float] = None) -> str:
+        """Transcribes a wav file, given either as a path or its content. Bytes
+        without a RIFF header are treated as raw 16-bit mono PCM"""
+        with self.recogniser(timeout) as recogniser:
+            return decode(recogniser, self._read_chunks(audio))
+
+    def transcribe_many(self, audio: Iterable[Audio]) -> List[str]:
+        """Transcribes the files using one thread per recogniser. The
+        transcriptions are returned in the same order as the files"""
+        with ThreadPoolExecutor(max_workers=self.size) as pool:
+            return list(pool.map(self.transcribe, audio))
+
+    def _read_chunks(self, audio: Audio) -> Iterator[bytes]:
+        if isinstance(audio, bytes) and not audio.startswith(b"RIFF"):
+            step = CHUNK_FRAMES * 2
+            for i in range(0, len(audio), step):
+                yield audio[i : i + step]
+            return
+
+        source = io.BytesIO(audio) if isinstance(audio, bytes) else str(audio)
+        with wave.open(source) as wf:
+            if (
+                wf.getframerate() != self.sample_rate
+                or wf.getnchannels() != 1
+                or wf.getsampwidth() != 2
+            ):
+                raise ValueError(
+                    f"Expected 16-bit mono audio at {self.sample_rate}Hz, got {wf.getsampwidth() * 8}-bit audio with {wf.getnchannels()} channel(s) at {wf.getframerate()}Hz"
+                )
+            yield from iter(lambda: wf.readframes(CHUNK_FRAMES), b"")
+
+
+def decode(recogniser: KaldiRecognizer, chunks: Iterable[bytes]) -> str:
+    """Passes the chunks of audio to the recogniser and returns the combined
+    text of the results. The recogniser is reset afterwards"""
+    results = []
+    for data in chunks:
+        if recogniser.AcceptWaveform(data):
+            results.append(_get_text(recogniser.Result()))
+
+    # Need to make sure that there is a result
+    final_result = _get_text(recogniser.FinalResult())
+    if final_result:
+        results.append(final_result)
+    recogniser.Reset()
+    return " ".join(results).strip()
+
+
+def _get_text(result: str) -> str:
+    return json.loads(result)["text"]
@@ -0,0 +1,115 @@
+import logging
+from math import gcd
+from pathlib import Path
+from typing import Protocol
+
+import numpy as np
+import soundfile as sf
+import sox
+from scipy.signal import resample_poly
+
+_logger = logging.getLogger(__name__)
+
+# Kaldi expects 16kHz, mono channel, 16-bit PCM wav files
+TARGET_SAMPLE_RATE = 16_000
+
+
+class AudioBackend(Protocol):
+    def convert_array(
+        self, data: np.ndarray, sample_rate: int, output_path: Path
+    ) -> None: ...
+
+    def convert_file(self, input_path: Path, output_path: Path) -> None: ...
+
+
+class SoundfileBackend:
+    """Decodes, downmixes, resamples, and encodes the audio in-process using
+    soundfile and a polyphase resampler. This avoids spawning a sox process for
+    every clip.
+
+    Like SoxBackend, the samples are rounded to 16 bits without dither. The
+    output is not bit-identical to sox, since the two resampling filters
+    differ slightly, but tests/test_audio.py checks that they agree to within
+    1% of full scale. MP3 clips with a LAME tag, such as the ones from Common
+    Voice, are also shorter: soundfile leaves out the delay that the encoder
+    adds at the start, where sox keeps it"""
+
+    def convert_array(
+        self, data: np.ndarray, sample_rate: int, output_path: Path
+    ) -> None:
+        # Downmix to a single channel
+        if data.ndim > 1:
+            data = data.mean(axis=1)
+
+        if sample_rate != TARGET_SAMPLE_RATE:
+            divisor = gcd(sample_rate, TARGET_SAMPLE_RATE)
+            data = resample_poly(
+                data, TARGET_SAMPLE_RATE // divisor, sample_rate // divisor
+            )
+
+        pcm = np.clip(np.round(data * 32768), -32768, 32767).astype(np.int16)
+        sf.write(output_path, pcm, TARGET_SAMPLE_RATE, subtype="PCM_16", format="WAV")
+
+    def convert_file(self, input_path: Path, output_path: Path) -> None:
+        data, sample_rate = sf.read(input_path, dtype="float64", always_2d=False)
+        self.convert_array(data, sample_rate, output_path)
+
+
+class SoxBackend:
+    """Converts the audio by running the sox binary"""
+
+    def convert_array(
+        self, data: np.ndarray, sample_rate: int, output_path: Path
+    ) -> None:
+        self._transformer().build(
+            input_array=data,
+            sample_rate_in=sample_rate,
+            output_filepath=output_path,
+        )
+
+    def convert_file(self, input_path: Path, output_path: Path) -> None:
+        self._transformer().build(
+            input_filepath=input_path,
+            output_filepath=output_path,
+        )
+
+    def _transformer(self) -> sox.Transformer:
+        tf = sox.Transformer()
+        # sox dithers by default when reducing the bit depth, which pysox
+        # already turns off with -D. It is set explicitly here since
+        # SoundfileBackend relies on neither backend dithering
+        tf.set_globals(dither=False)
+        tf.convert(samplerate=TARGET_SAMPLE_RATE, n_channels=1, bitdepth=16)
+        return tf
+
+
+class FallbackBackend:
+    """Tries the in-process backend first and falls back to sox for the files
+    that soundfile is unable to decode (e.g. mp3 with older versions of libsndfile)"""
+
+    def __init__(self):
+        self._primary = SoundfileBackend()
+        self._fallback = SoxBackend()
+
+    def convert_array(
+        self, data: np.ndarray, sample_rate: int, output_path: Path
+    ) -> None:
+        self._primary.convert_array(data, sample_rate, output_path)
+
+    def convert_file(self, input_path: Path, output_path: Path) -> None:
+        try:
+            self._primary.convert_file(input_path, output_path)
+        except sf.LibsndfileError:
+            _logger.debug(f"soundfile could not decode '{input_path}', using sox")
+            self._fallback.convert_file(input_path, output_path)
+
+
+BACKENDS: dict[str, type[AudioBackend]] = {
+    "auto": FallbackBackend,
+    "soundfile": SoundfileBackend,
+    "sox": SoxBackend,
+}
+
+
+def get_backend(name: str = "auto") -> AudioBackend:
+    return BACKENDS[name]()
@@ -1,5 +1,6 @@
 import logging
 import os
+from concurrent.futures import Executor
 from pathlib import Path
 
 import datasets
@@ -7,11 +8,14 @@ from dotenv import load_dotenv
 
 from vosk_cymraeg.datasets.hf_utils import (
     create_combined_split,
-    dump_dataset_audio_files,
+    stream_split_to_disk,
 )
+from vosk_cymraeg.datasets.progress import DatasetProgress
 
 
-def fetch_banc_trawsgrifiadau_bangor(output_path: Path) -> None:
+def fetch_banc_trawsgrifiadau_bangor(
+    output_path: Path, pool: Executor, progress: DatasetProgress, backend: str = "auto"
+) -> None:
     logger = logging.getLogger(__name__)
     logger.info(
         "Loading dataset 'techiaith/banc-trawsgrifiadau-bangor' from HuggingFace"
@@ -25,31 +29,25 @@ def fetch_banc_trawsgrifiadau_bangor(output_path: Path) -> None:
     dataset_splits = ["train", "validation", "test"]
 
     for split in dataset_splits:
-        ds: datasets.Dataset = datasets.load_dataset(
-            "techiaith/banc-trawsgrifiadau-bangor", split=split, token=token
+        ds: datasets.IterableDataset = datasets.load_dataset(
+            "techiaith/banc-trawsgrifiadau-bangor",
+            split=split,
+            token=token,
+            streaming=True,
         )
 
         # Since the data contains no speaker information we can treat all utterances as unique
         # speakers which means that the format for each clip is btb-<speaker>-0000
-        ds = ds.add_column(
-            "speaker", [f"btb-{i + speaker_count:06d}" for i in range(len(ds))]
-        )
-        ds = ds.add_column(
-            "utterance", [f"btb-{i + speaker_count:06d}-0000" for i in range(len(ds))]
-        )
-
-        # Update speaker count
-        speaker_count += len(ds)
-
-        # Batch dumps all of the bytes in audio
-        ds = ds.add_column("path", dump_dataset_audio_files(ds, output_path))
-        ds = ds.add_column("lang", ["cy" for _ in range(len(ds))])
-
-        # Audio can then be dumped to save memory
-        ds = ds.remove_columns("audio")
-        ds.to_csv(
-            output_path / f"{split}.csv",
-            columns=["speaker", "utterance", "path", "lang", "sentence"],
+        speaker_count += stream_split_to_disk(
+            ds,
+            output_path,
+            split,
+            "btb",
+            pool,
+            progress,
+            offset=speaker_count,
+            lang="cy",
+            backend=backend,
         )
 
     # Combine all datasets into one
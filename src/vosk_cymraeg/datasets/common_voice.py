@@ -1,93 +1,216 @@
 import logging
+import os
+import time
+from concurrent.futures import Executor
+from functools import partial
 from pathlib import Path
 
 import polars as pl
-import sox
-from tqdm import tqdm
+import soundfile as sf
+
+from vosk_cymraeg.datasets.audio import get_backend
+from vosk_cymraeg.datasets.hf_utils import CHUNK_SIZE
+from vosk_cymraeg.datasets.progress import DatasetProgress
 
 _logger = logging.getLogger(__name__)
 
 DATASET_SPLITS = ["train", "test", "dev", "other"]
 
 
-def process_common_voice(input_path: Path, output_path: Path) -> None:
+def process_common_voice(
+    input_path: Path,
+    output_path: Path,
+    pool: Executor,
+    progress: DatasetProgress,
+    backend: str = "auto",
+) -> None:
     _logger.info(f"Loading Common Voice data from local path {str(input_path)!r}")
+    # Each TSV is only parsed once and shared between the steps below
+    tsv = load_splits(input_path)
+
     # Determine length of speaker IDs
-    cid_length = determine_cid_length(input_path)
+    cid_length = determine_cid_length(tsv["client_id"])
     _logger.info(f"Smallest N that still yields unique client IDs is {cid_length}")
 
-    for split in tqdm(DATASET_SPLITS, desc="Converting splits"):
-        # Load the data and construct required columns
-        df = (
-            pl.scan_csv(input_path / f"{split}.tsv", separator="\t", quote_char="")
-            .with_columns(speaker="cvcy-" + pl.col("client_id").str.slice(-cid_length))
-            .with_columns(
-                utterance=pl.col("speaker")
-                + "-"
-                + pl.col("path").str.extract("([0-9]+)")
-            )
-            .select(["speaker", "utterance", "sentence", "path"])
-            .collect()
+    # Clips that have been converted by previous runs are listed in the manifest
+    output_path.mkdir(parents=True, exist_ok=True)
+    manifest_path = output_path / "manifest.tsv"
+    if not manifest_path.exists() and (output_path / "clips").exists():
+        seed_manifest(manifest_path, output_path / "clips")
+    converted = read_manifest(manifest_path)
+    if converted:
+        _logger.info(f"Resuming: {len(converted):,} clips have already been converted")
+
+    # Construct required columns
+    tsv = (
+        tsv.lazy()
+        .with_columns(speaker="cvcy-" + pl.col("client_id").str.slice(-cid_length))
+        .with_columns(
+            utterance=pl.col("speaker") + "-" + pl.col("path").str.extract("([0-9]+)")
         )
+        .select(["split", "speaker", "utterance", "sentence", "path"])
+        .collect()
+    )
 
-        # Loop through each file and convert from mp3 to wav
-        converted_paths = []
-        for row in tqdm(df.rows(named=True), desc="Converting files"):
-            new_path = output_path / "clips" / f"{row['utterance']}.wav"
-            converted_paths.append(str(new_path))
-            convert_file(
-                input_path / "clips" / row["path"],
-                new_path,
-            )
+    dfs = []
+    for split in DATASET_SPLITS:
+        df = tsv.filter(pl.col("split") == split).drop("split")
+
+        # Convert the clips that are not in the manifest from mp3 to wav
+        todo = df.filter(~pl.col("utterance").is_in(list(converted)))
+        _logger.info(
+            f"Split '{split}': {len(df) - len(todo):,} clips already converted, {len(todo):,} remaining"
+        )
+        convert_clips(
+            split,
+            [input_path / "clips" / path for path in todo["path"]],
+            [output_path / "clips" / f"{utt}.wav" for utt in todo["utterance"]],
+            todo["utterance"].to_list(),
+            manifest_path,
+            pool,
+            progress,
+            backend=backend,
+        )
 
         df = df.with_columns(
-            pl.Series("path", converted_paths), pl.lit("cy").alias("lang")
+            pl.format(
+                "{}/{}.wav", pl.lit(str(output_path / "clips")), "utterance"
+            ).alias("path"),
+            pl.lit("cy").alias("lang"),
         )
 
         # Select only the stuff we need and write to a csv file
-        df.select(["speaker", "utterance", "path", "lang", "sentence"]).write_csv(
-            output_path / f"{split}.csv"
-        )
+        df = df.select(["speaker", "utterance", "path", "lang", "sentence"])
+        df.write_csv(output_path / f"{split}.csv")
+        dfs.append(df)
 
     # Combine all splits and write to csv
-    dfs = [pl.read_csv(output_path / f"{split}.csv") for split in DATASET_SPLITS]
     pl.concat(dfs).write_csv(output_path / "all.csv")
 
 
-def determine_cid_length(input_path: Path) -> int:
-    # Check if we can reduce the speakers to a five letter combination
-    dfs = [
-        pl.read_csv(input_path / f"{split}.tsv", separator="\t", quote_char="")
-        for split in DATASET_SPLITS
-    ]
-    combined = pl.concat(dfs)
-
-    unique_speakers = combined["client_id"].unique()
-    for length in range(4, len(combined["client_id"][0]) + 1):
-        shortened = {cid[-length:] for cid in unique_speakers}
-        if len(shortened) == len(unique_speakers):
-            return length
+def convert_clips(
+    split: str,
+    input_paths: list[Path],
+    output_paths: list[Path],
+    utterances: list[str],
+    manifest_path: Path,
+    pool: Executor,
+    progress: DatasetProgress,
+    batch_size: int = 1000,
+    backend: str = "auto",
+) -> None:
+    """Converts the clips using the pool of worker processes and appends each
+    finished clip to the manifest so that an interrupted run can pick up where
+    it left off. The clips are given to the pool one batch at a time, so that
+    the datasets that share the pool take turns"""
+    if not utterances:
+        return
 
-    raise ValueError("Unable to resolve a unique set of speakers")
+    progress.split(split)
+    start = time.perf_counter()
+    audio_seconds = 0.0
+    with open(manifest_path, "a", encoding="utf-8") as manifest:
+        for i in range(0, len(utterances), batch_size):
+            durations = pool.map(
+                partial(_convert_clip, backend=backend),
+                input_paths[i : i + batch_size],
+                output_paths[i : i + batch_size],
+                chunksize=CHUNK_SIZE,
+            )
+            for utterance, duration in zip(utterances[i : i + batch_size], durations):
+                manifest.write(f"{utterance}\t{duration:.3f}\n")
+                manifest.flush()
+                audio_seconds += duration
+                progress.advance()
+
+    elapsed = time.perf_counter() - start
+    audio_hours = audio_seconds / 3600
+    _logger.info(
+        f"Converted {len(utterances):,} clips ({audio_hours:.2f} hours of audio) in {elapsed:.1f}s: "
+        f"{len(utterances) / elapsed:.1f} clips/s, {audio_hours / elapsed:.4f} audio-hours/s"
+    )
 
 
-def convert_file(input_path: Path, output_path: Path, overwrite: bool = False) -> bool:
+def read_manifest(manifest_path: Path) -> set[str]:
+    """Returns the utterances that are listed in the manifest"""
+    if not manifest_path.exists():
+        return set()
+    with open(manifest_path, encoding="utf-8") as manifest:
+        return {line.split("\t", 1)[0] for line in manifest if line.endswith("\n")}
+
+
+def seed_manifest(manifest_path: Path, clips_path: Path) -> None:
+    """Creates the manifest from the clips that were converted before there was
+    one, so that these are not converted again. Files that soundfile cannot read
+    or that hold no audio are left out, and are converted again"""
+    _logger.info(f"No manifest yet, listing the clips that exist in '{clips_path}'")
+    tmp_path = manifest_path.with_name(f"{manifest_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as manifest:
+        for path in sorted(clips_path.glob("*.wav")):
+            try:
+                duration = sf.info(path).duration
+            except sf.LibsndfileError:
+                continue
+            if duration > 0:
+                manifest.write(f"{path.stem}\t{duration:.3f}\n")
+    os.replace(tmp_path, manifest_path)
+
+
+def _convert_clip(input_path: Path, output_path: Path, backend: str = "auto") -> float:
+    """Converts a single clip and returns the duration of the audio in seconds.
+    Clips that are not in the manifest may be partially written, so these are
+    always overwritten"""
+    convert_file(input_path, output_path, overwrite=True, backend=backend)
+    return sf.info(output_path).duration
+
+
+def load_splits(input_path: Path) -> pl.DataFrame:
+    """Reads the TSV files for all of the splits in one go. The name of the split
+    each row came from is stored in the 'split' column"""
+    return pl.concat(
+        [
+            pl.scan_csv(input_path / f"{split}.tsv", separator="\t", quote_char="")
+            .select(["client_id", "path", "sentence"])
+            .with_columns(split=pl.lit(split))
+            for split in DATASET_SPLITS
+        ]
+    ).collect()
+
+
+def determine_cid_length(client_ids: pl.Series, min_length: int = 4) -> int:
+    """Finds the smallest N for which the last N characters of the client IDs are
+    still unique. If a suffix is unique then so are all longer suffixes, so the
+    length can be found using a binary search"""
+    client_ids = client_ids.unique()
+    n_unique = len(client_ids)
+
+    def is_unique(length: int) -> bool:
+        return client_ids.str.slice(-length).n_unique() == n_unique
+
+    low, high = min_length, max(min_length, client_ids.str.len_chars().max())
+    if not is_unique(high):
+        raise ValueError("Unable to resolve a unique set of speakers")
+
+    while low < high:
+        middle = (low + high) // 2
+        if is_unique(middle):
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+
+def convert_file(
+    input_path: Path, output_path: Path, overwrite: bool = False, backend: str = "auto"
+) -> bool:
     """Converts the CV .mp3 file provided to a mono channel, 16kHz wav file. If
     the file exists and overwrite is set to false nothing happens."""
     if not overwrite and output_path.exists():
         return
 
-    # Set up transformer
-    tf = sox.Transformer()
-    tf.convert(samplerate=16_000, n_channels=1, bitdepth=16)
-
     # If parent folder doesn't exist, make
     output_path.parent.mkdir(exist_ok=True, parents=True)
 
     # Write converted file to disk
-    status, _, _ = tf.build(
-        input_filepath=input_path,
-        output_filepath=output_path,
-        return_output=True,
-    )
-    return status
+    get_backend(backend).convert_file(input_path, output_path)
+    return True
@@ -1,15 +1,19 @@
 import logging
+from concurrent.futures import Executor
 from pathlib import Path
 
 import datasets
 
 from vosk_cymraeg.datasets.hf_utils import (
     create_combined_split,
-    dump_dataset_audio_files,
+    stream_split_to_disk,
 )
+from vosk_cymraeg.datasets.progress import DatasetProgress
 
 
-def fetch_enwau_cymraeg(output_path: Path) -> None:
+def fetch_enwau_cymraeg(
+    output_path: Path, pool: Executor, progress: DatasetProgress, backend: str = "auto"
+) -> None:
     logger = logging.getLogger(__name__)
     logger.info("Loading dataset 'wanasash/enwaucymraeg' from HuggingFace")
 
@@ -18,30 +22,22 @@ def fetch_enwau_cymraeg(output_path: Path) -> None:
 
     dataset_splits = ["train", "dev", "test"]
     for split in dataset_splits:
-        ds: datasets.Dataset = datasets.load_dataset(
-            "wanasash/enwaucymraeg", split=split
+        ds: datasets.IterableDataset = datasets.load_dataset(
+            "wanasash/enwaucymraeg", split=split, streaming=True
         )
-        ds = ds.add_column("lang", ["cy" for _ in range(len(ds))])
 
         # Same as Banc: Since we don't have any info every utterance is a unique speaker
-        ds = ds.add_column(
-            "speaker", [f"enw-{i + speaker_count:06d}" for i in range(len(ds))]
+        speaker_count += stream_split_to_disk(
+            ds,
+            output_path,
+            split,
+            "enw",
+            pool,
+            progress,
+            offset=speaker_count,
+            lang="cy",
+            backend=backend,
         )
-        ds = ds.add_column(
-            "utterance", [f"enw-{i + speaker_count:06d}-0000" for i in range(len(ds))]
-        )
-        speaker_count += len(ds)
-
-        ds = ds.add_column("path", dump_dataset_audio_files(ds, output_path))
-
-        # Audio can then be dumped to save memory
-        ds = ds.remove_columns("audio")
-        ds.to_csv(
-            output_path / f"{split}.csv",
-            columns=["speaker", "utterance", "path", "lang", "sentence"],
-        )
-
-    # Combine all datasets into one
 
     # Combine all datasets into one
     all_df = create_combined_split(output_path, dataset_splits)
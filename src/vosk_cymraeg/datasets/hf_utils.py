@@ -1,44 +1,102 @@
-import math
-from functools import reduce
+from concurrent.futures import Executor
+from functools import partial, reduce
 from io import BytesIO
 from pathlib import Path
 
 import datasets
 import polars as pl
 import soundfile as sf
-import sox
-from tqdm import tqdm
 
-
-def dump_dataset_audio_files(
-    ds: datasets.Dataset, output_path: Path, batch_size: int = 1000
-) -> Path:
-    number_of_batches = math.ceil(len(ds) / batch_size)
-
-    # Produced paths to return later
-    paths = []
-
-    # Batch dumps all of the bytes in audio
-    for batch in tqdm(
-        ds.to_polars(batched=True, batch_size=batch_size),
-        total=number_of_batches,
-        desc="Converting batches of audio",
-    ):
-        for row in tqdm(
-            batch.iter_rows(named=True),
-            leave=False,
-            total=len(batch),
-            desc="Converting clips",
-        ):
-            file_path = output_path / "clips" / f"{row['utterance']}.wav"
-            paths.append(str(file_path))
-            dump_bytes_to_file(row["audio"]["bytes"], file_path)
-
-    return paths
+from vosk_cymraeg.datasets.audio import get_backend
+from vosk_cymraeg.datasets.progress import DatasetProgress
+
+# Number of clips sent to a worker at a time
+CHUNK_SIZE = 16
+
+
+def stream_split_to_disk(
+    ds: datasets.IterableDataset,
+    output_path: Path,
+    split: str,
+    prefix: str,
+    pool: Executor,
+    progress: DatasetProgress,
+    offset: int = 0,
+    lang: str | None = None,
+    batch_size: int = 1000,
+    backend: str = "auto",
+) -> int:
+    """Writes the audio and the CSV file for a split one batch at a time, so the
+    memory usage does not depend on the size of the dataset.
+
+    Since the datasets contain no speaker information every utterance is treated
+    as a unique speaker, which means that the format for each clip is
+    <prefix>-<speaker>-0000, where the speakers are numbered from offset. If lang
+    is None the language is read from the 'lang' column of the dataset. The
+    clips are converted by the given pool of worker processes using the named
+    audio backend.
+
+    Returns the number of rows in the split"""
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    # Read the raw bytes instead of decoding the audio into arrays
+    ds = ds.cast_column("audio", datasets.Audio(decode=False))
+
+    progress.split(split)
+    count = 0
+    with open(output_path / f"{split}.csv", "w", encoding="utf-8") as csv_file:
+        for batch in ds.iter(batch_size=batch_size):
+            ids = range(offset + count, offset + count + len(batch["sentence"]))
+            df = pl.DataFrame(
+                {
+                    "speaker": [f"{prefix}-{i:06d}" for i in ids],
+                    "utterance": [f"{prefix}-{i:06d}-0000" for i in ids],
+                }
+            )
+            batch_paths = [
+                output_path / "clips" / f"{utterance}.wav"
+                for utterance in df["utterance"]
+            ]
+            _dump_batch(
+                [audio["bytes"] for audio in batch["audio"]],
+                batch_paths,
+                pool,
+                progress,
+                backend,
+            )
+
+            df = df.with_columns(
+                pl.Series("path", [str(path) for path in batch_paths]),
+                pl.Series("lang", batch["lang"])
+                if lang is None
+                else pl.lit(lang).alias("lang"),
+                pl.Series("sentence", batch["sentence"], dtype=pl.String),
+            )
+            df.write_csv(csv_file, include_header=count == 0)
+            count += len(df)
+
+        if count == 0:
+            csv_file.write("speaker,utterance,path,lang,sentence\n")
+
+    return count
+
+
+def _dump_batch(
+    audio: list[bytes],
+    paths: list[Path],
+    pool: Executor,
+    progress: DatasetProgress,
+    backend: str,
+) -> None:
+    # Only one batch per dataset is in flight at a time to keep the memory
+    # bounded, and so that the datasets take turns on the shared pool
+    dump = partial(dump_bytes_to_file, backend=backend)
+    for _ in pool.map(dump, audio, paths, chunksize=CHUNK_SIZE):
+        progress.advance()
 
 
 def dump_bytes_to_file(
-    bytes: bytes, output_path: Path, overwrite: bool = False
+    bytes: bytes, output_path: Path, overwrite: bool = False, backend: str = "auto"
 ) -> bool:
     if not overwrite and output_path.exists():
         return
@@ -46,21 +104,12 @@ def dump_bytes_to_file(
     # Read audio data
     data, sample_rate = sf.read(BytesIO(bytes))
 
-    # Set up transformer
-    tf = sox.Transformer()
-    tf.convert(samplerate=16_000, n_channels=1, bitdepth=16)
-
     # If parent folder doesn't exist, make
     output_path.parent.mkdir(exist_ok=True, parents=True)
 
     # Write converted file to disk
-    status, _, _ = tf.build(
-        input_array=data,
-        sample_rate_in=sample_rate,
-        output_filepath=output_path,
-        return_output=True,
-    )
-    return status
+    get_backend(backend).convert_array(data, sample_rate, output_path)
+    return True
 
 
 def create_combined_split(
@@ -0,0 +1,43 @@
+from rich.progress import (
+    Progress,
+    SpinnerColumn,
+    TextColumn,
+    TimeElapsedColumn,
+)
+
+
+def fetch_progress(**kwargs) -> Progress:
+    """A progress display with one line per dataset, showing the split that is
+    being converted and the number of clips converted so far"""
+    return Progress(
+        SpinnerColumn(),
+        TextColumn("{task.description}"),
+        TextColumn("[dim]{task.fields[split]}"),
+        TextColumn("{task.completed:,.0f} clips"),
+        TimeElapsedColumn(),
+        **kwargs,
+    )
+
+
+class DatasetProgress:
+    """The line of a single dataset in the progress display. The datasets are
+    fetched at the same time, so they report to one shared display rather than
+    each drawing their own progress bar"""
+
+    def __init__(self, progress: Progress, name: str):
+        self._progress = progress
+        self._task = progress.add_task(name, split="")
+
+    def split(self, split: str) -> None:
+        self._progress.update(self._task, split=split)
+
+    def advance(self, clips: int = 1) -> None:
+        self._progress.advance(self._task, clips)
+
+    def finish(self, status: str) -> None:
+        self._progress.update(self._task, split=status)
+        self._progress.stop_task(self._task)
+
+    @property
+    def completed(self) -> int:
+        return int(self._progress.tasks[self._task].completed)
@@ -0,0 +1,142 @@
+import re
+from collections import Counter
+from typing import Optional
+
+import numpy as np
+import polars as pl
+from rapidfuzz.distance import Levenshtein
+
+# Per-utterance counts returned by error_counts. The word and char columns use
+# the same whitespace handling as jiwer (and the 'wer' and 'cer' metrics from
+# evaluate), while the raw_char columns compare the characters as they are,
+# like universal_edit_distance does
+COUNT_SCHEMA = {
+    "word_substitutions": pl.Int64,
+    "word_deletions": pl.Int64,
+    "word_insertions": pl.Int64,
+    "word_reference_length": pl.Int64,
+    "char_substitutions": pl.Int64,
+    "char_deletions": pl.Int64,
+    "char_insertions": pl.Int64,
+    "char_reference_length": pl.Int64,
+    "raw_char_errors": pl.Int64,
+    "raw_char_reference_length": pl.Int64,
+}
+
+_MULTIPLE_SPACES = re.compile(r"\s\s+")
+
+# Upper bound on the number of resampling weights kept in memory at once
+_MAX_BOOTSTRAP_WEIGHTS = 2**24
+
+
+def error_counts(predictions: list[str], references: list[str]) -> pl.DataFrame:
+    """Aligns every prediction with its reference and returns the number of
+    substitutions, deletions, and insertions, and the length of the reference,
+    both in words and in characters. Identical pairs are only aligned once"""
+    pairs = pl.DataFrame(
+        {"prediction": predictions, "reference": references},
+        schema={"prediction": pl.String, "reference": pl.String},
+    )
+    unique = pairs.unique(maintain_order=True)
+    counts = pl.DataFrame(
+        [_align(prediction, reference) for prediction, reference in unique.iter_rows()],
+        schema=COUNT_SCHEMA,
+        orient="row",
+    )
+    return pairs.join(
+        pl.concat([unique, counts], how="horizontal"),
+        on=["prediction", "reference"],
+        how="left",
+        maintain_order="left",
+    ).drop("prediction", "reference")
+
+
+def error_rates(split: pl.Expr = pl.lit(True)) -> dict[str, pl.Expr]:
+    """Expressions for the corpus level (wer/cer) and mean utterance level
+    (uwer/ucer) error rates of the utterances in the split, computed from the
+    columns returned by error_counts"""
+
+    def errors(unit: str) -> pl.Expr:
+        return (
+            pl.col(f"{unit}_substitutions")
+            + pl.col(f"{unit}_deletions")
+            + pl.col(f"{unit}_insertions")
+        ).filter(split)
+
+    def length(unit: str) -> pl.Expr:
+        return pl.col(f"{unit}_reference_length").filter(split)
+
+    return {
+        "wer": errors("word").sum() / length("word").sum(),
+        "cer": errors("char").sum() / length("char").sum(),
+        "uwer": (errors("word") / length("word")).mean(),
+        "ucer": (
+            pl.col("raw_char_errors").filter(split)
+            / pl.col("raw_char_reference_length").filter(split)
+        ).mean(),
+    }
+
+
+def bootstrap_rates(
+    errors: np.ndarray,
+    lengths: np.ndarray,
+    resamples: int = 10_000,
+    rng: Optional[np.random.Generator] = None,
+) -> np.ndarray:
+    """Draws resamples of the utterances with replacement and returns the
+    corpus level error rate of every system on every resample.
+
+    errors and lengths have one row per utterance and one column per system.
+    All of the systems are resampled with the same utterances, so the rates
+    can be compared pairwise (paired bootstrap). Returns an array with one row
+    per resample and one column per system"""
+    rng = rng or np.random.default_rng()
+    utterances, systems = errors.shape
+    values = np.hstack([errors, lengths]).astype(np.float64)
+    rates = np.empty((resamples, systems))
+
+    # Every resample is stored as the number of times each utterance was drawn,
+    # so the totals of a block of resamples are a single matrix product
+    block = max(1, _MAX_BOOTSTRAP_WEIGHTS // max(utterances, 1))
+    for start in range(0, resamples, block):
+        size = min(block, resamples - start)
+        draws = rng.integers(0, utterances, size=(size, utterances))
+        draws += utterances * np.arange(size)[:, None]
+        weights = np.bincount(draws.ravel(), minlength=size * utterances)
+        totals = weights.reshape(size, utterances).astype(np.float64) @ values
+        rates[start : start + size] = totals[:, :systems] / totals[:, systems:]
+    return rates
+
+
+def _align(prediction: str, reference: str) -> tuple[int, ...]:
+    prediction_text = _MULTIPLE_SPACES.sub(" ", prediction).strip()
+    reference_text = _MULTIPLE_SPACES.sub(" ", reference).strip()
+    reference_words = _split_words(reference_text)
+
+    char_edits = _count_edits(prediction_text, reference_text)
+    if prediction_text == prediction and reference_text == reference:
+        raw_char_errors = sum(char_edits)
+    else:
+        raw_char_errors = sum(_count_edits(prediction, reference))
+
+    return (
+        *_count_edits(_split_words(prediction_text), reference_words),
+        len(reference_words),
+        *char_edits,
+        len(reference_text),
+        raw_char_errors,
+        len(reference),
+    )
+
+
+def _split_words(text: str) -> list[str]:
+    return [word for word in text.split(" ") if word]
+
+
+def _count_edits(prediction, reference) -> tuple[int, int, int]:
+    """Returns the number of substitutions, deletions, and insertions needed to
+    turn the reference into the prediction"""
+    if prediction == reference:
+        return 0, 0, 0
+    tags = Counter(tag for tag, _, _ in Levenshtein.editops(reference, prediction))
+    return tags["replace"], tags["delete"], tags["insert"]
@@ -1,42 +1,96 @@
+from functools import lru_cache
+
+import polars as pl
 from text_process.normalise import cleanup_utf8_chars, cleanup_spaces
 
 VALID_CHARS = (
     "ABCDEFGHIJKLMNOPQRSTUVWXYZÂÊÎÔÛŴŶÏÖ abcdefghijklmnopqrstuvwxyzâêîôûŵŷï'-<>_áéöòàäë"
 )
 
+SPECIAL_TAGS = (
+    "<anadlu i mewn yn sydyn>",
+    "<chwythu allan>",
+    "<clirio gwddf>",
+)
+
+# Applied in order, so the result of one replacement is seen by the next one
+REPLACEMENTS = (
+    ("*", ""),
+    ("[anadl]", "<anadlu>"),
+    ("<chwerthin)", "<chwerthin>"),
+    ("{aneglur}", "<aneglur>"),
+    ("{chwerthin}", "<chwerthin>"),
+    ("–", "-"),
+    ("¬", "-"),
+    ("—", "-"),
+    ("/", ""),
+    ("''", "'"),
+)
+
+PUNCTUATION = ',.?!…;:"'
+
+# Matches the characters str.split() treats as whitespace
+_WHITESPACE_PATTERN = r"[\s\x1c-\x1f]+"
+
 
 def normalise_sentence(s: str) -> str:
-    for special_tag in [
-        "<anadlu i mewn yn sydyn>",
-        "<chwythu allan>",
-        "<clirio gwddf>",
-    ]:
+    for special_tag in SPECIAL_TAGS:
         if special_tag in s:
             s = s.replace(special_tag, special_tag.replace(" ", "_"))
 
     # Normalize apostrophes
     s = cleanup_utf8_chars(s)
-    s = (
-        s.replace("*", "")
-        .replace("[anadl]", "<anadlu>")
-        .replace("<chwerthin)", "<chwerthin>")
-        .replace("{aneglur}", "<aneglur>")
-        .replace("{chwerthin}", "<chwerthin>")
-        .replace("–", "-")
-        .replace("¬", "-")
-        .replace("—", "-")
-        .replace("/", "")
-        .replace("''", "'")
-    )
+    for old, new in REPLACEMENTS:
+        s = s.replace(old, new)
 
     s = cleanup_spaces(remove_punctuation(s)).strip()
     return s.lower()  # We could preserve capitalized words in the future
 
 
+def normalise_expr(col: str | pl.Expr) -> pl.Expr:
+    """Polars expression equivalent of normalise_sentence.
+
+    Runs the same steps as normalise_sentence, but on whole columns at a time
+    instead of calling back into Python for every row."""
+    expr = pl.col(col) if isinstance(col, str) else col
+    for special_tag in SPECIAL_TAGS:
+        expr = expr.str.replace_all(
+            special_tag, special_tag.replace(" ", "_"), literal=True
+        )
+
+    expr = expr.map_batches(_cleanup_utf8_chars_batch, return_dtype=pl.String)
+    for old, new in REPLACEMENTS:
+        expr = expr.str.replace_all(old, new, literal=True)
+
+    return (
+        expr.str.replace_many({c: "" for c in PUNCTUATION})
+        .str.replace_all(_WHITESPACE_PATTERN, " ")
+        .str.strip_chars()
+        .str.to_lowercase()
+    )
+
+
+def _cleanup_utf8_chars_batch(s: pl.Series) -> pl.Series:
+    """cleanup_utf8_chars substitutes one character at a time, so instead of
+    running it on every sentence we run it once per distinct character in the
+    batch and apply the resulting table in one go"""
+    chars = s.str.split("").explode().drop_nulls().unique().to_list()
+    table = {c: _cleanup_utf8_char(c) for c in chars}
+    table = {c: r for c, r in table.items() if c != r}
+    if not table:
+        return s
+    return s.str.replace_many(table)
+
+
+@lru_cache(maxsize=None)
+def _cleanup_utf8_char(c: str) -> str:
+    return cleanup_utf8_chars(c)
+
+
 def remove_punctuation(sentence: str) -> str:
     kept_chars = []
     for c in sentence:
-        if c in ',.?!…;:"':
+        if c in PUNCTUATION:
             continue
         kept_chars.append(c)
     cleaned = "".join(kept_chars)
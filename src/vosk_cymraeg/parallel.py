@@ -0,0 +1,70 @@
+"""Pools of worker processes used by the scripts and the dataset loaders.
+
+Polars runs its queries on a pool of threads that is started the first time it
+is used. Forking a process copies the memory of those threads but not the
+threads themselves, so a lock that one of them held at the time of the fork is
+never released in the child, and the first Polars call in the child can hang.
+The workers are therefore spawned from a fresh interpreter by default.
+"""
+
+import multiprocessing
+import sys
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from multiprocessing.context import BaseContext
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+
+def can_fork() -> bool:
+    """Whether the workers can be forked on this platform. macOS is excluded
+    since several of its system libraries are not safe to use after a fork"""
+    return (
+        "fork" in multiprocessing.get_all_start_methods() and sys.platform != "darwin"
+    )
+
+
+def context(fork: bool = False) -> BaseContext:
+    """The context that process_pool starts its workers with. Locks and other
+    synchronisation primitives given to the workers must come from it"""
+    return multiprocessing.get_context("fork" if fork and can_fork() else "spawn")
+
+
+def process_pool(
+    jobs: int,
+    initializer: Optional[Callable[..., Any]] = None,
+    initargs: tuple = (),
+    fork: bool = False,
+) -> ProcessPoolExecutor:
+    """Returns a pool of jobs worker processes.
+
+    If fork is set and the platform supports it, the workers are forked instead
+    of spawned, so that whatever the parent has loaded is shared copy-on-write
+    with them. That is only safe if the workers never use Polars"""
+    return ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=context(fork),
+        initializer=initializer,
+        initargs=initargs,
+    )
+
+
+class InlineExecutor(Executor):
+    """Runs the calls in the thread that maps them instead of in a worker
+    process. It takes the place of a pool with a single worker, which would only
+    add the cost of sending the arguments and the results between processes.
+    Threads that share it take turns, so only one call runs at a time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def map(
+        self,
+        fn: Callable[..., Any],
+        *iterables: Iterable,
+        timeout: Optional[float] = None,
+        chunksize: int = 1,
+    ) -> Iterator:
+        for args in zip(*iterables):
+            with self._lock:
+                result = fn(*args)
+            yield result
@@ -0,0 +1,116 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+
+import polars as pl
+
+_logger = logging.getLogger(__name__)
+
+# Compiled versions of the dictionaries are stored here, next to the submodules
+CACHE_PATH = Path("data/external/cache")
+
+# Bump this whenever the parsing or the layout of the table changes
+CACHE_VERSION = 2
+
+
+def load_dictionary(
+    path: Path, pattern: re.Pattern, cache_path: Path = CACHE_PATH
+) -> pl.DataFrame:
+    """Loads a Bangor pronunciation dictionary as a table with the columns 'Word',
+    'Pronunciation', and 'IPA'. The rows are sorted by 'Word', keeping the order
+    of the pronunciations of each word, so that single words can be found with a
+    binary search.
+
+    The parsed table is cached as an Arrow IPC file which is memory mapped on later
+    loads, so processes that load the same dictionary share the same pages instead
+    of each parsing the text file. The cache is rebuilt if the modification time
+    of the dictionary changes and its content hash no longer matches, or if the
+    pattern used to parse it is different."""
+    cache_file = cache_path / f"{path.name}.arrow"
+    meta_file = cache_path / f"{path.name}.arrow.json"
+
+    stat = path.stat()
+    meta = _read_meta(meta_file, pattern)
+    if meta is not None and cache_file.exists():
+        if meta["mtime_ns"] == stat.st_mtime_ns and meta["size"] == stat.st_size:
+            return pl.read_ipc(cache_file, memory_map=True)
+
+        # The file has been touched, but the content might still be the same
+        digest = _hash_file(path)
+        if meta["sha256"] == digest:
+            _write_meta(meta_file, pattern, stat, digest)
+            return pl.read_ipc(cache_file, memory_map=True)
+    else:
+        digest = _hash_file(path)
+
+    _logger.info(f"Compiling '{path}' to '{cache_file}'")
+    table = parse_dictionary(path, pattern).sort("Word", maintain_order=True)
+    cache_path.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first so that other processes never see a
+    # partially written cache
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    table.write_ipc(tmp_file, compression="uncompressed")
+    os.replace(tmp_file, cache_file)
+    _write_meta(meta_file, pattern, stat, digest)
+
+    return pl.read_ipc(cache_file, memory_map=True)
+
+
+def parse_dictionary(path: Path, pattern: re.Pattern) -> pl.DataFrame:
+    """Parses the text version of a Bangor pronunciation dictionary"""
+    text = path.read_text()
+    words = []
+    for line in text.splitlines():
+        res = pattern.fullmatch(line)
+        words.append(
+            (
+                res.group(1),
+                res.group(2).replace("'", "").replace("-", "").split(),
+                res.group(3),
+            )
+        )
+    return pl.DataFrame(
+        words,
+        orient="row",
+        schema={
+            "Word": pl.String,
+            "Pronunciation": pl.List(pl.String),
+            "IPA": pl.String,
+        },
+    )
+
+
+def _hash_file(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _read_meta(meta_file: Path, pattern: re.Pattern) -> dict | None:
+    try:
+        meta = json.loads(meta_file.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if meta.get("version") != CACHE_VERSION or meta.get("pattern") != pattern.pattern:
+        return None
+    return meta
+
+
+def _write_meta(
+    meta_file: Path, pattern: re.Pattern, stat: os.stat_result, digest: str
+) -> None:
+    tmp_file = meta_file.with_name(f"{meta_file.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(
+        json.dumps(
+            {
+                "version": CACHE_VERSION,
+                "pattern": pattern.pattern,
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "sha256": digest,
+            }
+        )
+    )
+    os.replace(tmp_file, meta_file)
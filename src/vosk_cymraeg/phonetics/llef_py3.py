@@ -126,6 +126,35 @@ CODAS = tuple(tuple(x.split('-')) for x in """
     j
 """.split())
 
+def build_trie(sequences):
+	"""Builds a trie of phone sequences. Each node maps a phone to the next node,
+	and the key None holds the sequence that ends at that node"""
+	trie = {}
+	for seq in sequences:
+		node = trie
+		for phone in seq:
+			node = node.setdefault(phone, {})
+		node[None] = seq
+	return trie
+
+ONSET_TRIE = build_trie(ONSETS)
+CODA_TRIE = build_trie(CODAS)
+
+def longest_match(trie, phones, start):
+	"""Returns the longest sequence in the trie that phones[start:] starts with.
+	ONSETS and CODAS list every cluster before its prefixes, so this gives the
+	same result as taking the first match in the tuples"""
+	node = trie
+	found = None
+	for i in range(start, len(phones)):
+		node = node.get(phones[i])
+		if node is None:
+			break
+		if None in node:
+			found = node[None]
+	return found
+
+
 STRESSED_EXCEPTIONS = {
 	'a': ('A'),
 	'ag': ('A', 'g'),
@@ -191,13 +220,15 @@ def get_syllables(word):
 	return syllables
 
 
+STRESSABLE_ACCENT_PATTERN = re.compile(r'[ÂÊÎÔÛŴŶÁÉÍÓÚẂÝ]')
+
 def add_stress(syllables):
 	"""modifies in place"""
 	# Stress at the (last) circumflex/acute accent, if there is one
 	for syll in reversed(syllables):
 		for i in reversed(range(len(syll.vowels))):
 			v = syll.vowels[i]
-			if re.match(r'[ÂÊÎÔÛŴŶÁÉÍÓÚẂÝ]', v):
+			if STRESSABLE_ACCENT_PATTERN.match(v):
 				syll.vowels[i] = v + '1'
 				return
 
@@ -242,48 +273,42 @@ def split_syllables(orig_phones, apostrophe_phone_indexes):
 	That's what we want so that position in the stressed syllable can reflect
 	vowel length.
 	"""
-	phones = orig_phones[:]
+	phones = orig_phones
+	n_phones = len(phones)
 	syllables = []
 
 
 	offset = 0
+	pos = 0
+
+	while pos < n_phones:
+		found_onset = longest_match(ONSET_TRIE, phones, pos)
+		if found_onset:
+			pos += len(found_onset)
 
-	while True:
-		if not phones:
-			break
-		found_onset = None
-		for onset in ONSETS:
-			if tuple(phones[:len(onset)]) == onset:
-				found_onset = onset
-				phones = phones[len(onset):]
-				break
-		
 		found_vowels = []
-		while phones and is_vowel_phone(phones[0]):
-			vowel = phones[0]
+		while pos < n_phones and is_vowel_phone(phones[pos]):
+			vowel = phones[pos]
 			found_vowels.append(vowel)
-			phones = phones[1:]
+			pos += 1
 			if vowel != 'I':
 				# Allow 'iad' etc to be one syllable
 				break
 		if not found_vowels:
-			raise ValueError('No vowels in syllable: orig_phones=%r, phones=%r' % (orig_phones, phones))
+			raise ValueError('No vowels in syllable: orig_phones=%r, phones=%r' % (orig_phones, phones[pos:]))
 
-		found_coda = None
-		for coda in CODAS:
-			if tuple(phones[:len(coda)]) == coda:
-				found_coda = coda
-				phones = phones[len(coda):]
-				break
+		found_coda = longest_match(CODA_TRIE, phones, pos)
+		if found_coda:
+			pos += len(found_coda)
 		syllable_length = len(found_onset or ()) + len(found_vowels) + len(found_coda or ())
 		precoda_length = len(found_onset or ()) + len(found_vowels)
 
 		# is_final if end of word, or if there is an apostrophe after the nucleus
-		is_final = (not phones)
+		is_final = pos >= n_phones
 		for i in range(offset + precoda_length + 1, offset + syllable_length + 1): # + 1 to look before the next syllable
 			if i in apostrophe_phone_indexes:
 				is_final = True
-	
+
 		syllables.append(Syllable(found_onset, found_vowels, found_coda, is_final))
 	return tuple(syllables)
 
@@ -430,19 +455,24 @@ ochr: O ch @ r
 class LogicError(RuntimeError):
 	pass
 
+CHARS_PATTERN = re.compile(r"ch|dd|ff|ngh|mh|nh|ng|ll|ph|rh|th|tsh|ts|sh|[bcdfghjlmnprst']|[aeouâêîôûäëïöüáéíóúàèìòùŵŷẅÿẃýẁỳ]|[iwy]", re.I|re.U)
+SIMPLE_CONS_PATTERN = re.compile(r'ch|dd|ff|ng|ll|ph|rh|th|mh|nh|ngh|tsh|ts|sh|[bcdfghjlmnprst]', re.I|re.U)
+# all vowels except i/w/y as these may be consonantal
+SIMPLE_VOWEL_CLUSTER_PATTERN = re.compile(r'[aeouâêîôûŵŷäëïöüẅÿáéíóúẃýàèìòùẁỳ]+', re.I)
+# all possible vowels, including i/w/y which may be consonantal
+POSSIBLE_VOWEL_CLUSTER_PATTERN = re.compile(r'[aeiouwyâêîôûŵŷäëïöüẅÿáéíóúẃýàèìòùẁỳ]+', re.I)
+
 def split_chars(word):
-	return re.findall(r"ch|dd|ff|ngh|mh|nh|ng|ll|ph|rh|th|tsh|ts|sh|[bcdfghjlmnprst']|[aeouâêîôûäëïöüáéíóúàèìòùŵŷẅÿẃýẁỳ]|[iwy]", word, re.I|re.U)
+	return CHARS_PATTERN.findall(word)
 
 def is_simple_cons(ch):
-	return re.match(r'ch|dd|ff|ng|ll|ph|rh|th|mh|nh|ngh|tsh|ts|sh|[bcdfghjlmnprst]', ch, re.I|re.U)
+	return SIMPLE_CONS_PATTERN.match(ch)
 
 def is_simple_vowel_cluster(ch):
-	# all vowels except i/w/y as these may be consonantal
-	return re.match(r'[aeouâêîôûŵŷäëïöüẅÿáéíóúẃýàèìòùẁỳ]+', ch, re.I)
+	return SIMPLE_VOWEL_CLUSTER_PATTERN.match(ch)
 
 def is_possible_vowel_cluster(ch):
-	# all possible vowels, including i/w/y which may be consonantal
-	return re.match(r'[aeiouwyâêîôûŵŷäëïöüẅÿáéíóúẃýàèìòùẁỳ]+', ch, re.I)
+	return POSSIBLE_VOWEL_CLUSTER_PATTERN.match(ch)
 
 def is_vowel_phone(ff):
 	return ff.isupper() or ff == '@'
@@ -471,7 +501,6 @@ def get_unstressed_phones(word):
 	partsAndApostrophes = split_chars(word.lower())
 	parts, apostrophePartIndexes = extract_apostrophes(partsAndApostrophes)
 
-	dictparts = dict((i, parts[i]) for i in range(len(parts)))
 	for i in range(len(parts)):
 		if i in apostrophePartIndexes:
 			apostrophePhoneIndexes.add(len(phones))
@@ -555,6 +584,11 @@ def append_i(phones, parts, i, pre, now, post, tail, tailstr):
 		print("append_i: This code should never be reached: " + repr((phones, parts, i, pre, now, post, tail)), file=sys.stderr)
 
 
+W_BEFORE_RYW_RIA_RO_PATTERN = re.compile(r'^(ryw|ria|ro)')
+COMPOUND_WL_PATTERN = re.compile(r'^(lad|ledydd|ledd|leidydd|latgar|orwlych)')
+COMPOUND_WN_PATTERN = re.compile(r'^(neud|neuthur)')
+COMPOUND_WR_PATTERN = re.compile(r'^(rand|rend|ragedd|raig|reidd)')
+
 def append_w(phones, parts, i, pre, now, post, tail, tailstr, apostrophePartIndexes):
 	# 1.3.1 Handle simple cases (not w[lnr]<vowel>)
 	if len(tail) < 2 or tail[0] not in 'lnr' or not is_possible_vowel_cluster(tail[1]):
@@ -566,7 +600,7 @@ def append_w(phones, parts, i, pre, now, post, tail, tailstr, apostrophePartInde
 	# If so, the l|n|r will be omitted in the next loop iteration.
 	if is_possible_vowel_cluster(pre):
 		phones.append('W')
-	elif re.match(r'^(ryw|ria|ro)', tailstr):
+	elif W_BEFORE_RYW_RIA_RO_PATTERN.match(tailstr):
 		# gwryw, wriaeth|wriad|wrian, wrol|wron|wrogaeth
 		phones.append('W')
 	elif ''.join(phones[-2:]) == 'sg' and post == 'l':
@@ -588,23 +622,32 @@ def append_w(phones, parts, i, pre, now, post, tail, tailstr, apostrophePartInde
 	# Compounded mutated gw[lnr]- is /w[lnr]/ . Approximate this by looking
 	# for likely compounds (mined from the hunspell word list: the tests are
 	# 100% accurate for that list)
-	elif post == 'l' and re.match(r'^(lad|ledydd|ledd|leidydd|latgar|orwlych)', tailstr):
+	elif post == 'l' and COMPOUND_WL_PATTERN.match(tailstr):
 		phones.append('wl')
-	elif post == 'n' and (re.match(r'^(neud|neuthur)', tailstr) or (tuple(phones[-2:]) == ('y', 'm') and post == 'n')):
+	elif post == 'n' and (COMPOUND_WN_PATTERN.match(tailstr) or (tuple(phones[-2:]) == ('y', 'm') and post == 'n')):
 		phones.append('wn')
-	elif post == 'r' and re.match(r'^(rand|rend|ragedd|raig|reidd)', tailstr):
+	elif post == 'r' and COMPOUND_WR_PATTERN.match(tailstr):
 		phones.append('wr')
 	else: 
 		phones.append('W')
 
+INNER_SPACE_PATTERN = re.compile(r'(?<=\S)\s+(?=\S)')
+DIPHTHONG_PATTERN = re.compile(r'(I W|E W|A W|O W|Y W|O I|A I|E I|A U|A E|O E|W Y|E U|U W)')
+
 def remove_inner_space(m):
-	return re.sub(r'(?<=\S)\s+(?=\S)', '', m.group(1))
+	return INNER_SPACE_PATTERN.sub('', m.group(1))
 
 def join_diphthongs(phones):
 	phonestring = ' '.join(phones)
-	phonestring = re.sub(r'(I W|E W|A W|O W|Y W|O I|A I|E I|A U|A E|O E|W Y|E U|U W)', remove_inner_space, phonestring)
+	phonestring = DIPHTHONG_PATTERN.sub(remove_inner_space, phonestring)
 	return phonestring.split(' ')
 
+W_VOWEL_WORD_PATTERN = re.compile(r'^([bfm]wa|dwi)$', re.UNICODE)
+OGWYDD_PATTERN = re.compile(r'^(g?ogwydd|(t|d|th|nh)ramgwydd.*)$')
+WY_WORD_PATTERN = re.compile(r'^(wy|gwy|frogwy|llugwy)$')
+VELAR_LEAD_PATTERN = re.compile(r'^(c|ch|g|ngh)$')
+YMP_PATTERN = re.compile(r'^ymp.*$')
+
 def get_type_of_w(phones, parts, i, pre, now, post, tail, tailstr, apostrophePartIndexes):
 	# lead and leadstr are unprocessed ouput from split_chars
 	lead = tuple(parts[:i])
@@ -612,7 +655,7 @@ def get_type_of_w(phones, parts, i, pre, now, post, tail, tailstr, apostrophePar
 
 	partstr = ''.join(parts)
 
-	if re.match(r'^([bfm]wa|dwi)$', partstr, re.UNICODE):
+	if W_VOWEL_WORD_PATTERN.match(partstr):
 		return 'W'
 	elif tailstr.startswith('ryw'):
 		return 'W'
@@ -625,13 +668,13 @@ def get_type_of_w(phones, parts, i, pre, now, post, tail, tailstr, apostrophePar
 	elif tailstr.startswith('y'):
 		if tailstr == 'yd':
 			return 'W'
-		elif re.match(r'^(g?ogwydd|(t|d|th|nh)ramgwydd.*)$', partstr):
+		elif OGWYDD_PATTERN.match(partstr):
 			return 'w'
-		elif re.match(r'^(wy|gwy|frogwy|llugwy)$', partstr):
+		elif WY_WORD_PATTERN.match(partstr):
 			return 'W'
-		elif re.match(r'^(c|ch|g|ngh)$', leadstr) and re.match(r'^ymp.*$', tailstr):
+		elif VELAR_LEAD_PATTERN.match(leadstr) and YMP_PATTERN.match(tailstr):
 			return 'w' # Cwympo: just a freaky exception
-		elif re.match(r'^(c|ch|g|ngh)$', leadstr):
+		elif VELAR_LEAD_PATTERN.match(leadstr):
 			return 'w' # Cwympo: just a freaky exception
 		elif pre == 'g': # XXX and not soft mutated  OR  pre == '' or 'ng' and mutated:
 			return 'W' # XXX fix with counterexamples below!
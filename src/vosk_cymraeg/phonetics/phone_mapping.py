@@ -0,0 +1,82 @@
+import hashlib
+import logging
+import os
+from io import StringIO
+from pathlib import Path
+
+import polars as pl
+import requests
+
+_logger = logging.getLogger(__name__)
+
+# The spreadsheet that maps the phones produced by llef_py3.py to the phone set
+# used by Geiriadur Ynganu Bangor
+MAPPING_URL = "https://docs.google.com/spreadsheets/d/1LekYLxMiBT3kRFxuNQPPXqAl2MZkhSqpwC4wUHxsVVo/export?gid=0&format=tsv"
+
+# Vendored snapshot of the spreadsheet and its checksum. Use the 'refresh'
+# script to update these
+MAPPING_PATH = Path(__file__).parent / "llef_to_bangor.tsv"
+CHECKSUM_PATH = MAPPING_PATH.with_name(MAPPING_PATH.name + ".sha256")
+
+
+def load_phone_mapping(path: Path = MAPPING_PATH) -> dict[str, str]:
+    """Loads the vendored llef -> Bangor phone mapping after verifying its
+    checksum. It never goes online, so that it works on machines without network
+    access and on read-only installs"""
+    if not path.exists():
+        raise FileNotFoundError(
+            f"The phone mapping snapshot '{path}' does not exist. Run 'uv run refresh' to download it"
+        )
+
+    text = path.read_bytes()
+    if read_checksum(path) != checksum(text):
+        raise ValueError(
+            f"The checksum of '{path}' does not match the vendored checksum. Run 'uv run refresh' to restore it"
+        )
+    return parse_phone_mapping(text.decode("utf-8"))
+
+
+def parse_phone_mapping(text: str) -> dict[str, str]:
+    lookup_table = pl.read_csv(StringIO(text), separator="\t").drop(
+        ["Notes", "Geriadur-ynganu-bangor equivalent"]
+    )
+    return {key: value for (key, value) in lookup_table.rows()}
+
+
+def fetch_phone_mapping() -> str:
+    """Downloads the current version of the mapping spreadsheet"""
+    r = requests.get(MAPPING_URL)
+    r.raise_for_status()
+    r.encoding = r.apparent_encoding  # Fix encoding
+    return r.text
+
+
+def checksum(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def read_checksum(path: Path = MAPPING_PATH) -> str:
+    checksum_path = path.with_name(path.name + ".sha256")
+    if not checksum_path.exists():
+        raise FileNotFoundError(
+            f"The checksum '{checksum_path}' of the phone mapping snapshot does not exist. Run 'uv run refresh' to recreate it"
+        )
+    return checksum_path.read_text().split()[0]
+
+
+def write_phone_mapping(text: str, path: Path = MAPPING_PATH) -> str:
+    """Writes a new snapshot alongside its checksum (in sha256sum format). Both
+    are written to temporary files first and then moved into place, so that
+    nothing ever reads a partially written snapshot"""
+    data = text.encode("utf-8")
+    digest = checksum(data)
+    checksum_path = path.with_name(path.name + ".sha256")
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_checksum_path = checksum_path.with_name(
+        f"{checksum_path.name}.{os.getpid()}.tmp"
+    )
+    tmp_path.write_bytes(data)
+    tmp_checksum_path.write_text(f"{digest}  {path.name}\n")
+    os.replace(tmp_path, path)
+    os.replace(tmp_checksum_path, checksum_path)
+    return digest
@@ -1,52 +1,80 @@
 import re
-from io import StringIO
 from pathlib import Path
-from typing import Protocol
+from typing import Iterable, Protocol
 
 import polars as pl
-import requests
 
+from vosk_cymraeg.phonetics.dictionary import load_dictionary
 from vosk_cymraeg.phonetics.llef_py3 import get_unstressed_phones
+from vosk_cymraeg.phonetics.phone_mapping import load_phone_mapping
 
 
 class Phonemizer(Protocol):
     def phonemize(self, word: str) -> list[list[str]]: ...
 
+    def phonemize_many(self, words: Iterable[str]) -> pl.DataFrame: ...
+
+
+def _lookup_many(table: pl.DataFrame, words: Iterable[str]) -> pl.DataFrame:
+    """Looks up all of the words in the dictionary table using a single join.
+    The table is only read, so its memory mapped pages stay shared between
+    processes. Words that are missing from the table get a null pronunciation"""
+    words = pl.DataFrame({"word": list(words)}, schema={"word": pl.String}).unique(
+        maintain_order=True
+    )
+    found = (
+        table.select(pl.col("Word").alias("word"), "Pronunciation")
+        .join(words, on="word", how="semi")
+        .group_by("word", maintain_order=True)
+        .agg(pl.col("Pronunciation").alias("pronunciation"))
+    )
+    return words.join(found, on="word", how="left", maintain_order="left")
+
+
+def _lookup(table: pl.DataFrame, word: str) -> list[list[str]]:
+    """Looks up a single word with a binary search of the sorted 'Word' column,
+    which only touches the pages of the memory mapped table that it needs"""
+    words = table["Word"]
+    start = words.search_sorted(word, side="left")
+    end = words.search_sorted(word, side="right")
+    return table["Pronunciation"][start:end].to_list()
+
 
 class CyPhonemizer:
-    def __init__(self):
-        """Loads Geiriadur Ynganu Bangor into memory and a pronunciation loopup table for llef_py3.py"""
-        PATTERN = re.compile("([^ ]+) (.+) (/.*/)")
-        text = Path("data/external/geiriadur-ynganu-bangor/bangordict.dict").read_text()
-        words = []
-        for line in text.splitlines():
-            res = PATTERN.fullmatch(line)
-            words.append(
-                (
-                    res.group(1),
-                    res.group(2).replace("'", "").replace("-", "").split(),
-                    res.group(3),
-                )
-            )
-        self._table = pl.DataFrame(
-            words, orient="row", schema=["Word", "Pronunciation", "IPA"]
+    def __init__(self, phone_mapping: dict[str, str] | None = None):
+        """Loads Geiriadur Ynganu Bangor into memory and a pronunciation loopup table for llef_py3.py.
+        A phone_mapping that has already been loaded with load_phone_mapping can
+        be passed in, e.g. by worker processes, instead of reading it again"""
+        self._table = load_dictionary(
+            Path("data/external/geiriadur-ynganu-bangor/bangordict.dict"),
+            re.compile("([^ ]+) (.+) (/.*/)"),
         )
 
-        # Create lookup table
-        r = requests.get(
-            "https://docs.google.com/spreadsheets/d/1LekYLxMiBT3kRFxuNQPPXqAl2MZkhSqpwC4wUHxsVVo/export?gid=0&format=tsv"
-        )
-        r.encoding = r.apparent_encoding  # Fix encoding
-        lookup_table = pl.read_csv(StringIO(r.text), separator="\t").drop(
-            ["Notes", "Geriadur-ynganu-bangor equivalent"]
+        # Load the vendored lookup table
+        self._lookup_dict = (
+            load_phone_mapping() if phone_mapping is None else phone_mapping
         )
-        self._lookup_dict = {key: value for (key, value) in lookup_table.rows()}
 
     def phonemize(self, word: str) -> list[list[str]]:
-        res = self._table.filter(pl.col("Word") == word)
-        if len(res):
-            return res["Pronunciation"].to_list()
+        return _lookup(self._table, word) or self._phonemize_with_rules(word)
 
+    def phonemize_many(self, words: Iterable[str]) -> pl.DataFrame:
+        """Phonemizes a whole vocabulary at once. Only the words that are missing
+        from the dictionary are passed on to llef_py3.py
+
+        Returns a DataFrame with the columns 'word' and 'pronunciation'"""
+        res = _lookup_many(self._table, words)
+        missing = res.filter(pl.col("pronunciation").is_null())["word"].to_list()
+        fallback = pl.DataFrame(
+            {
+                "word": missing,
+                "pronunciation": [self._phonemize_with_rules(word) for word in missing],
+            },
+            schema=res.schema,
+        )
+        return res.update(fallback, on="word")
+
+    def _phonemize_with_rules(self, word: str) -> list[list[str]]:
         try:
             return [
                 [
@@ -60,26 +88,19 @@ class CyPhonemizer:
 
 class EnPhonemizer:
     def __init__(self):
-        PATTERN = re.compile("([^ ]+) \(.+\) (.+) (/.*/)")
-        text = Path(
-            "data/external/geiriadur-ynganu-bangor/bangordict.en.dict"
-        ).read_text()
-        words = []
-        for line in text.splitlines():
-            res = PATTERN.fullmatch(line)
-            words.append(
-                (
-                    res.group(1),
-                    res.group(2).replace("'", "").replace("-", "").split(),
-                    res.group(3),
-                )
-            )
-        self._table = pl.DataFrame(
-            words, orient="row", schema=["Word", "Pronunciation", "IPA"]
+        self._table = load_dictionary(
+            Path("data/external/geiriadur-ynganu-bangor/bangordict.en.dict"),
+            re.compile(r"([^ ]+) \(.+\) (.+) (/.*/)"),
         )
 
     def phonemize(self, word: str) -> list[list[str]]:
-        res = self._table.filter(pl.col("Word") == word)
-        if len(res):
-            return res["Pronunciation"].to_list()
-        return []
+        return _lookup(self._table, word)
+
+    def phonemize_many(self, words: Iterable[str]) -> pl.DataFrame:
+        """Phonemizes a whole vocabulary at once. Words that are missing from
+        the dictionary get no pronunciations
+
+        Returns a DataFrame with the columns 'word' and 'pronunciation'"""
+        return _lookup_many(self._table, words).with_columns(
+            pl.col("pronunciation").fill_null([])
+        )
@@ -0,0 +1,250 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import time
+import wave
+from datetime import datetime
+from multiprocessing.synchronize import Barrier
+from pathlib import Path
+from threading import BrokenBarrierError
+from typing import List, Optional
+
+import polars as pl
+from rich import print
+from rich.logging import RichHandler
+from rich.table import Table
+from tqdm import tqdm
+from vosk import KaldiRecognizer, Model, SetLogLevel
+
+from vosk_cymraeg.parallel import context, process_pool
+from vosk_cymraeg.scripts.test_model import transcribe_file
+
+_logger = logging.getLogger(__name__)
+
+# Seconds that a worker waits for the others to load their model before the
+# benchmark is abandoned
+WARMUP_TIMEOUT = 600
+
+
+def main() -> None:
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    args = parse_args()
+
+    dataset = pl.read_csv(args.test_data)
+    if args.limit is not None:
+        dataset = dataset.head(args.limit)
+    paths = dataset["path"].to_list()
+    _logger.info(f"Benchmarking on {len(paths)} utterances from '{args.test_data}'")
+
+    summaries, utterances = [], []
+    for model_path in args.model:
+        for jobs in args.jobs:
+            _logger.info(f"Benchmarking '{model_path.name}' with {jobs} worker(s)")
+            model_summary, model_utterances = benchmark_model(model_path, paths, jobs)
+            summaries.append(model_summary)
+            utterances.append(model_utterances)
+
+    summary = pl.DataFrame(summaries)
+    print(_summary_table(summary))
+
+    output_path: Path = args.output
+    if output_path is None:
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output_path = Path("results/benchmarks") / f"benchmark_{timestamp}"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    summary.write_csv(output_path.with_suffix(".csv"))
+    pl.concat(utterances).write_csv(output_path.with_suffix(".utterances.csv"))
+    output_path.with_suffix(".json").write_text(
+        json.dumps(
+            {
+                "test_data": str(args.test_data),
+                "utterances": len(paths),
+                "machine": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "results": summaries,
+            },
+            indent=2,
+        )
+    )
+    _logger.info(f"Wrote the results to '{output_path.with_suffix('.json')}'")
+
+
+def benchmark_model(
+    model_path: Path, paths: List[str], jobs: int
+) -> tuple[dict, pl.DataFrame]:
+    """Transcribes the files with a fresh pool of workers and returns a summary
+    of the timings together with the timings of every utterance.
+
+    Every worker is a new process, so the load time and peak memory usage are
+    those of a single model rather than whatever was loaded before it. The wall
+    time only starts once every worker has loaded its model, so that it
+    measures the decoding alone"""
+    startup = time.perf_counter()
+    records = []
+    barrier = context().Barrier(jobs)
+    with process_pool(
+        jobs, initializer=_init_worker, initargs=(model_path, barrier)
+    ) as pool:
+        # Every worker blocks in one of these until all of them have started
+        # and loaded the model, so each of them gets exactly one
+        try:
+            list(pool.map(_wait_for_workers, range(jobs)))
+        except BrokenBarrierError:
+            raise RuntimeError(
+                f"Not all of the {jobs} workers had loaded '{model_path}' within {WARMUP_TIMEOUT}s"
+            ) from None
+        start = time.perf_counter()
+        for record in tqdm(
+            pool.map(_benchmark_file, paths),
+            desc=f"Decoding ({model_path.name}, {jobs} jobs)",
+            total=len(paths),
+        ):
+            records.append(record)
+        wall_time = time.perf_counter() - start
+    startup_time = start - startup
+
+    utterances = pl.DataFrame(
+        records,
+        schema={
+            "path": pl.String,
+            "pid": pl.Int64,
+            "load_seconds": pl.Float64,
+            "peak_rss_mb": pl.Float64,
+            "audio_seconds": pl.Float64,
+            "decode_seconds": pl.Float64,
+        },
+        orient="row",
+    ).with_columns(rtf=pl.col("decode_seconds") / pl.col("audio_seconds"))
+    workers = utterances.group_by("pid").agg(
+        pl.col("load_seconds").first(), pl.col("peak_rss_mb").max()
+    )
+
+    audio_seconds = utterances["audio_seconds"].sum()
+    decode_seconds = utterances["decode_seconds"].sum()
+    summary = {
+        "model": model_path.name,
+        "jobs": jobs,
+        "utterances": len(utterances),
+        "audio_seconds": audio_seconds,
+        "startup_seconds": startup_time,
+        "wall_seconds": wall_time,
+        "load_seconds": workers["load_seconds"].mean(),
+        "peak_rss_mb": workers["peak_rss_mb"].max(),
+        "total_rss_mb": workers["peak_rss_mb"].sum(),
+        "rtf": decode_seconds / audio_seconds,
+        "rtf_p50": utterances["rtf"].quantile(0.5),
+        "rtf_p90": utterances["rtf"].quantile(0.9),
+        "rtf_p99": utterances["rtf"].quantile(0.99),
+        "utterances_per_second": len(utterances) / wall_time,
+        "audio_seconds_per_second": audio_seconds / wall_time,
+        # The amount of CPU time needed to decode one hour of audio
+        "cpu_seconds_per_audio_hour": decode_seconds / (audio_seconds / 3600),
+    }
+    utterances = utterances.select(
+        pl.lit(model_path.name).alias("model"),
+        pl.lit(jobs).alias("jobs"),
+        "path",
+        "pid",
+        "audio_seconds",
+        "decode_seconds",
+        "rtf",
+    )
+    return summary, utterances
+
+
+def _summary_table(summary: pl.DataFrame) -> Table:
+    table = Table(title="Benchmark")
+    columns = {
+        "model": "Model",
+        "jobs": "Jobs",
+        "load_seconds": "Load (s)",
+        "peak_rss_mb": "Peak RSS (MB)",
+        "rtf_p50": "RTF p50",
+        "rtf_p90": "RTF p90",
+        "rtf_p99": "RTF p99",
+        "utterances_per_second": "Utt/s",
+        "cpu_seconds_per_audio_hour": "CPU s / audio h",
+    }
+    for name in columns.values():
+        table.add_column(name, justify="left" if name == "Model" else "right")
+    for row in summary.select(columns.keys()).iter_rows():
+        table.add_row(
+            *[
+                f"{value:.3f}" if isinstance(value, float) else str(value)
+                for value in row
+            ]
+        )
+    return table
+
+
+# Each worker process holds its own model and recogniser
+_load_time: float = 0.0
+_recogniser: Optional[KaldiRecognizer] = None
+_barrier: Optional[Barrier] = None
+
+
+def _init_worker(model_path: Path, barrier: Barrier) -> None:
+    global _load_time, _recogniser, _barrier
+    SetLogLevel(-1)
+    start = time.perf_counter()
+    model = Model(str(model_path))
+    _load_time = time.perf_counter() - start
+    _recogniser = KaldiRecognizer(model, 16_000)
+    _barrier = barrier
+
+
+def _wait_for_workers(_) -> None:
+    _barrier.wait(timeout=WARMUP_TIMEOUT)
+
+
+def _benchmark_file(path: str) -> tuple:
+    with wave.open(path) as wf:
+        audio_seconds = wf.getnframes() / wf.getframerate()
+
+    start = time.perf_counter()
+    transcribe_file(_recogniser, path)
+    decode_seconds = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return (
+        path,
+        os.getpid(),
+        _load_time,
+        peak_rss_mb,
+        audio_seconds,
+        decode_seconds,
+    )
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        "benchmark",
+        description="Script responsible for measuring the decoding cost of Vosk models",
+    )
+    parser.add_argument("--model", required=True, type=Path, nargs="+")
+    parser.add_argument("--test-data", required=True, type=Path)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        nargs="+",
+        default=[1],
+        help="The numbers of worker processes to benchmark each model with (e.g. 1 2 4 8)",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="Only use the first N utterances of the test data",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Where to write the results. The .json and .csv extensions are added automatically",
+    )
+    return parser.parse_args()
@@ -1,136 +1,337 @@
+import argparse
+import os
+from pathlib import Path
+from typing import Optional
+
 import datasets
+import numpy as np
 import polars as pl
+from scipy.stats import f as f_distribution
 
-from vosk_cymraeg.normalisation import normalise_sentence
-import universal_edit_distance as ued
-from scipy.stats.mstats import f_oneway
+from vosk_cymraeg.metrics import error_counts
+from vosk_cymraeg.normalisation import normalise_expr
 
+# The accents of the reference set are cached here after the first download
+CACHE_PATH = Path("data/external/cache")
 
-ACCENTS = ("De Ddwyrain", "Gogledd Orllewin")#, "De Orllewin")
+ACCENTS = ("De Ddwyrain", "Gogledd Orllewin")  # , "De Orllewin")
 
-def main() -> None:
-    df_names = [
-        "DewiBrynJones/evals-ca25-whisper-large-v3-ft-btb-cv-ca-cy",
-        "DewiBrynJones/evals-ca25-whisper-large-v3-ft-btb-ca-cy",
-    ]
+# Result sets that contain the sentence and accent of every utterance
+HF_RESULTS = [
+    "DewiBrynJones/evals-ca25-whisper-large-v3-ft-btb-cv-ca-cy",
+    "DewiBrynJones/evals-ca25-whisper-large-v3-ft-btb-ca-cy",
+]
 
-    # Load datasets
-    df_dict = {name: load_hf_dataset(name) for name in df_names}
-    df_dict.update(load_kaldi_dataset("prvInSpace/evals-kaldi-full-model"))
-    df_dict.update(load_kaldi_dataset("prvInSpace/evals-kaldi-bilingual"))
-    df_dict.update(load_kaldi_dataset("prvInSpace/evals-kaldi-all-with-corpus"))
-    df_dict.update(load_kaldi_dataset("prvInSpace/evals-kaldi-ner-full"))
-    df_dict.update(load_kaldi_dataset("prvInSpace/evals-kaldi-ner-text-only"))
+# Result sets produced by the 'test' script, which are joined with the test set
+KALDI_RESULTS = [
+    "prvInSpace/evals-kaldi-full-model",
+    "prvInSpace/evals-kaldi-bilingual",
+    "prvInSpace/evals-kaldi-all-with-corpus",
+    "prvInSpace/evals-kaldi-ner-full",
+    "prvInSpace/evals-kaldi-ner-text-only",
+]
 
-    res = pl.DataFrame([get_normalised_values(df) for df in df_dict.values()])
-    print(res)
-    lookup = res.mean().transpose(
-        include_header=True, header_name="accent", column_names=["correction"]
-    )
+# Upper bound on the number of permuted labels kept in memory at once
+_MAX_PERMUTED_LABELS = 2**24
 
-    def get_bias(model: str):
-        tmp = df_dict[model]
-        tmp = tmp.join(lookup, on="accent", how="left").with_columns(
-            (pl.col("wer") / pl.col("correction")).alias("corrected_wer")
-        )
-        wer_pv = analyse_variance(tmp, "wer")
-        cwer_pv = analyse_variance(tmp, "corrected_wer")
-        return {"model": model, "bias": wer_pv, "bias_corrected": cwer_pv}
-    
-    bias_table = pl.DataFrame([
-        get_bias(model)
-        for model in df_dict
-    ])
-    print(bias_table)
-
-
-def analyse_variance(df: pl.DataFrame, field: str):
-    accent_data = {
-        accent: df.filter(pl.col("accent") == accent)[field]
-        for accent in df["accent"].unique()
-        if accent in ACCENTS
-    }
-    print(f"{df[field].mean():.2%} Overall")
-    for accent, data in sorted(accent_data.items(), key=lambda x: x[1].mean()):
-        print(f"{data.mean():.2%}", f"{len(data):4d}", accent)
-
-    res = f_oneway(*[v.to_list() for v in accent_data.values()])
-    print(res)
-    return res.pvalue
 
+def main() -> None:
+    args = parse_args()
 
-def load_hf_dataset(dataset: str) -> pl.DataFrame:
-    df = (
-        datasets.load_dataset(dataset, split="test")
-        .to_polars()
-        .drop("audio")
-        .rename({"prediction": "transcription"})
-        .with_columns(
-            pl.col("sentence").map_elements(normalise_sentence, pl.String),
-            pl.col("transcription").map_elements(normalise_sentence, pl.String),
-        )
+    reference = load_reference(
+        args.test_data, args.reference, args.reference_split, args.cache_path
     )
-    return (
-        df.with_columns(
-            pl.Series(
-                "wer",
-                ued.word_error_rate(df["transcription"], df["sentence"]),
-            )
-        )
-        .drop_nans("wer")
-        .filter(pl.col("wer").is_finite())
+    results = compute_wer(load_results(args.hf_results, args.kaldi_results, reference))
+
+    accents = accent_summary(results, args.accents)
+    corrections = accents.group_by("accent", maintain_order=True).agg(
+        correction=pl.col("relative_wer").mean()
     )
+    print(corrections)
 
+    results = results.join(corrections, on="accent", how="inner").with_columns(
+        (pl.col("wer") / pl.col("correction")).alias("corrected_wer")
+    )
+    accents = accents.join(
+        results.group_by("model", "accent").agg(pl.col("corrected_wer").mean()),
+        on=["model", "accent"],
+        how="left",
+        maintain_order="left",
+    )
 
-def load_kaldi_dataset(dataset: str) -> pl.DataFrame:
-    lla_test = (
-        datasets.load_dataset("cymen-arfor/lleisiau-arfor", split="test_clean")
-        .remove_columns("audio")
-        .to_polars()
+    rng = np.random.default_rng(args.seed)
+    wer_pv = analyse_variance(results, "wer", args.permutations, rng)
+    cwer_pv = analyse_variance(results, "corrected_wer", args.permutations, rng)
+    bias_table = wer_pv.join(
+        cwer_pv, on="model", how="left", maintain_order="left", suffix="_corrected"
+    ).rename(
+        {
+            "p_value": "bias",
+            "p_value_corrected": "bias_corrected",
+            "permutation_p_value": "bias_permutation",
+            "permutation_p_value_corrected": "bias_corrected_permutation",
+        }
     )
-    lla_test = lla_test.with_columns(pl.int_range(0, len(lla_test)).alias("id"))
+
+    with pl.Config(tbl_rows=-1, fmt_str_lengths=80):
+        print(accents)
+        print(bias_table)
+
+
+def load_reference(
+    test_data: Path, dataset: str, split: str, cache_path: Path = CACHE_PATH
+) -> pl.DataFrame:
+    """Returns the Lleisiau Arfor utterances of the test set together with the
+    accent of their speaker"""
     test_set = (
-        pl.read_csv("data/processed/dataset/test.csv")
+        pl.read_csv(test_data)
         .filter(pl.col("speaker").str.starts_with("lla"))
         .with_columns(
             pl.col("speaker").str.strip_prefix("lla-").cast(pl.Int64).alias("id")
         )
         .with_columns(pl.col("id") - pl.col("id").min())
     )
+    return test_set.join(load_accents(dataset, split, cache_path), on="id")
+
 
-    test_set = test_set.join(lla_test.select(["id", "accent"]), on="id")
-    to_test = datasets.load_dataset(dataset, split="test").to_polars()
+def load_accents(
+    dataset: str, split: str, cache_path: Path = CACHE_PATH
+) -> pl.DataFrame:
+    """Returns the accent of every row of the dataset. The accents are cached as
+    an Arrow IPC file, so the dataset is only loaded the first time. Delete the
+    file to load them again"""
+    cache_file = cache_path / f"{dataset.replace('/', '--')}.{split}.accents.arrow"
+    if cache_file.exists():
+        return pl.read_ipc(cache_file, memory_map=False)
 
-    results_table = test_set.join(
-        to_test.select(["speaker", "transcription"]), on="speaker", how="left"
-    ).with_columns(
-        pl.col("sentence").map_elements(normalise_sentence, pl.String),
-        pl.col("transcription").map_elements(normalise_sentence, pl.String),
+    accents = (
+        datasets.load_dataset(dataset, split=split)
+        .select_columns("accent")
+        .to_polars()
+        .with_row_index("id")
+        .with_columns(pl.col("id").cast(pl.Int64))
     )
+    cache_path.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first so that other processes never see a
+    # partially written cache
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    accents.write_ipc(tmp_file)
+    os.replace(tmp_file, cache_file)
+    return accents
+
+
+def load_results(
+    hf_results: list[str], kaldi_results: list[str], reference: pl.DataFrame
+) -> pl.DataFrame:
+    """Combines the result sets into one table with the columns 'model',
+    'accent', 'sentence', and 'transcription'"""
+    columns = ["model", "accent", "sentence", "transcription"]
+    tables = [
+        load_hf_dataset(name).with_columns(model=pl.lit(name)).select(columns)
+        for name in hf_results
+    ]
+    if kaldi_results:
+        # Every model gets a row for every utterance of the reference, even if
+        # the utterance is missing from its results
+        transcriptions = pl.concat(
+            load_kaldi_dataset(name).with_columns(model=pl.lit(name))
+            for name in kaldi_results
+        )
+        tables.append(
+            reference.join(pl.DataFrame({"model": kaldi_results}), how="cross")
+            .join(transcriptions, on=["model", "speaker"], how="left")
+            .select(columns)
+        )
+    return pl.concat(tables)
+
+
+def load_hf_dataset(dataset: str) -> pl.DataFrame:
+    data = datasets.load_dataset(dataset, split="test")
+    if "audio" in data.column_names:
+        data = data.remove_columns("audio")
+    return data.to_polars().rename({"prediction": "transcription"})
+
+
+def load_kaldi_dataset(dataset: str) -> pl.DataFrame:
+    """Loads the results of the 'test' script, either from a dataset on the
+    Hugging Face Hub or from a local CSV file"""
+    if Path(dataset).is_file():
+        results = pl.read_csv(dataset, schema_overrides={"transcription": pl.String})
+    else:
+        results = datasets.load_dataset(dataset, split="test").to_polars()
+    return results.select(["speaker", "transcription"])
 
-    # print(results_table)
-    return {
-        dataset: results_table.with_columns(
-            pl.Series(
-                "wer",
-                ued.word_error_rate(
-                    results_table["transcription"], results_table["sentence"]
-                ),
+
+def compute_wer(results: pl.DataFrame) -> pl.DataFrame:
+    """Normalises the text and adds the WER of every utterance. Utterances
+    without any words in the reference are dropped"""
+    results = results.with_columns(
+        normalise_expr("sentence"),
+        normalise_expr("transcription"),
+    )
+    counts = error_counts(
+        results["transcription"].fill_null("").to_list(),
+        results["sentence"].to_list(),
+    )
+    return results.with_columns(
+        (
+            (
+                counts["word_substitutions"]
+                + counts["word_deletions"]
+                + counts["word_insertions"]
             )
+            / counts["word_reference_length"]
+        ).alias("wer")
+    ).filter(pl.col("wer").is_finite())
+
+
+def accent_summary(
+    results: pl.DataFrame, accents: Optional[list[str]] = None
+) -> pl.DataFrame:
+    """Mean WER of every model for every accent, both as is and relative to the
+    mean WER of the model across all accents"""
+    overall = results.group_by("model").agg(overall_wer=pl.col("wer").mean())
+    if accents is not None:
+        results = results.filter(pl.col("accent").is_in(accents))
+    return (
+        results.group_by("model", "accent")
+        .agg(utterances=pl.len(), wer=pl.col("wer").mean())
+        .join(overall, on="model")
+        .with_columns(relative_wer=pl.col("wer") / pl.col("overall_wer"))
+        .sort("model", "wer")
+    )
+
+
+def analyse_variance(
+    results: pl.DataFrame,
+    field: str,
+    permutations: int = 10_000,
+    rng: Optional[np.random.Generator] = None,
+) -> pl.DataFrame:
+    """One-way ANOVA of the field across the accents of every model. The F
+    statistic is computed from the sums of the accent groups, and the p-value
+    is given both from the F distribution and from a permutation test which
+    shuffles the accents of the utterances"""
+    rng = rng or np.random.default_rng()
+    groups = results.group_by("model", "accent").agg(
+        n=pl.len(),
+        mean=pl.col(field).mean(),
+        ss=((pl.col(field) - pl.col(field).mean()) ** 2).sum(),
+    )
+    grand_mean = (pl.col("n") * pl.col("mean")).sum() / pl.col("n").sum()
+    table = (
+        groups.group_by("model")
+        .agg(
+            groups=pl.len(),
+            utterances=pl.col("n").sum(),
+            ssb=(pl.col("n") * (pl.col("mean") - grand_mean) ** 2).sum(),
+            ssw=pl.col("ss").sum(),
+        )
+        .with_columns(
+            f=(pl.col("ssb") / (pl.col("groups") - 1))
+            / (pl.col("ssw") / (pl.col("utterances") - pl.col("groups")))
         )
-        .drop_nans("wer")
-        .filter(pl.col("wer").is_finite())
-    }
-
-
-def get_normalised_values(results_table: pl.DataFrame) -> dict[str, float]:
-    overall_wer = results_table["wer"].mean()
-    return {
-        accent: results_table.filter(pl.col("accent") == accent)["wer"].mean()
-        / overall_wer
-        for accent in results_table["accent"].unique()
-        if accent  in ACCENTS
-    }
+    )
+
+    # Keep the order of the models as given
+    order = results.select(pl.col("model").unique(maintain_order=True))
+    table = order.join(table, on="model", how="left", maintain_order="left")
+    by_model = results.partition_by("model", as_dict=True)
+    table = table.with_columns(
+        p_value=pl.Series(
+            f_distribution.sf(
+                table["f"].to_numpy(),
+                table["groups"].to_numpy() - 1,
+                table["utterances"].to_numpy() - table["groups"].to_numpy(),
+            )
+        ),
+        permutation_p_value=pl.Series(
+            [
+                _permutation_p_value(
+                    by_model[(model,)][field].to_numpy(),
+                    by_model[(model,)]["accent"].to_numpy(),
+                    f,
+                    permutations,
+                    rng,
+                )
+                for model, f in table.select("model", "f").iter_rows()
+            ],
+            dtype=pl.Float64,
+        ),
+    )
+    return table.select("model", "f", "p_value", "permutation_p_value")
+
+
+def _permutation_p_value(
+    values: np.ndarray,
+    labels: np.ndarray,
+    f_observed: float,
+    permutations: int,
+    rng: np.random.Generator,
+) -> float:
+    _, codes = np.unique(labels, return_inverse=True)
+    groups, utterances = codes.max() + 1, len(values)
+    if groups < 2 or utterances <= groups:
+        return float("nan")
+
+    # The group sizes and the total sum of squares are the same for every
+    # permutation, so only the between group sum of squares has to be computed
+    sizes = np.bincount(codes, minlength=groups)
+    total = values.sum()
+    sst = ((values - values.mean()) ** 2).sum()
+    exceeded = 0
+    block = max(1, _MAX_PERMUTED_LABELS // utterances)
+    for start in range(0, permutations, block):
+        size = min(block, permutations - start)
+        permuted = rng.permuted(np.tile(codes, (size, 1)), axis=1)
+        permuted += groups * np.arange(size)[:, None]
+        sums = np.bincount(
+            permuted.ravel(), weights=np.tile(values, size), minlength=size * groups
+        ).reshape(size, groups)
+        ssb = (sums**2 / sizes).sum(axis=1) - total**2 / utterances
+        f = (ssb / (groups - 1)) / ((sst - ssb) / (utterances - groups))
+        exceeded += np.count_nonzero(f >= f_observed)
+    return (exceeded + 1) / (permutations + 1)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        "bias",
+        description="Script responsible for analysing the accent bias of the models",
+    )
+    parser.add_argument(
+        "--hf-results",
+        nargs="*",
+        default=HF_RESULTS,
+        help="Datasets on the Hugging Face Hub with the sentence, prediction and accent of every utterance",
+    )
+    parser.add_argument(
+        "--kaldi-results",
+        nargs="*",
+        default=KALDI_RESULTS,
+        help="Results of the 'test' script, given as datasets on the Hugging Face Hub or local CSV files",
+    )
+    parser.add_argument(
+        "--accents",
+        nargs="+",
+        default=list(ACCENTS),
+        help="The accents to compare",
+    )
+    parser.add_argument(
+        "--test-data", type=Path, default=Path("data/processed/dataset/test.csv")
+    )
+    parser.add_argument("--reference", default="cymen-arfor/lleisiau-arfor")
+    parser.add_argument("--reference-split", default="test_clean")
+    parser.add_argument("--cache-path", type=Path, default=CACHE_PATH)
+    parser.add_argument(
+        "--permutations",
+        type=int,
+        default=10_000,
+        help="Number of permutations used by the permutation test",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
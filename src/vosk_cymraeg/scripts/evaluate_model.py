@@ -1,21 +1,42 @@
 import argparse
+import hashlib
 import logging
-from io import TextIOWrapper
+import os
+from itertools import combinations
 from pathlib import Path
-from typing import Callable
+from typing import Optional
 
-import evaluate
+import numpy as np
 import polars as pl
 from rich.logging import RichHandler
-from universal_edit_distance import (
-    character_mean_error_rate,
-    word_mean_error_rate,
-)
 
-from vosk_cymraeg.normalisation import normalise_sentence
+from vosk_cymraeg.metrics import bootstrap_rates, error_counts, error_rates
+from vosk_cymraeg.normalisation import normalise_expr
+from vosk_cymraeg.parallel import process_pool
 
 _logger = logging.getLogger(__name__)
 
+# Splits that we are using, given as filters on the results
+SPLITS: dict[str, pl.Expr] = {
+    "all": pl.lit(True),
+    "cy": pl.col("lang") == "cy",
+    "en": pl.col("lang") == "en",
+    "read-speech": pl.col("speaker").str.starts_with("cvcy"),
+    "spon-speech": ~pl.col("speaker").str.starts_with("cvcy"),
+    "spon-speech-cy": ~pl.col("speaker").str.starts_with("cvcy")
+    & (pl.col("lang") == "cy"),
+    "spon-speech-en": ~pl.col("speaker").str.starts_with("cvcy")
+    & (pl.col("lang") == "en"),
+    "btb": pl.col("speaker").str.starts_with("btb"),
+    "cvcy": pl.col("speaker").str.starts_with("cvcy"),
+    "lla": pl.col("speaker").str.starts_with("lla"),
+    "lla-en": pl.col("speaker").str.starts_with("lla") & (pl.col("lang") == "en"),
+    "lla-cy": pl.col("speaker").str.starts_with("lla") & (pl.col("lang") == "cy"),
+}
+
+# Bump this whenever the way the alignments are computed changes
+CACHE_VERSION = 1
+
 
 def main() -> None:
     logging.basicConfig(
@@ -23,13 +44,40 @@ def main() -> None:
     )
 
     parser = argparse.ArgumentParser()
+    parser.add_argument("--test-results", required=True, type=Path, nargs="+")
+    parser.add_argument("--normalise", action="store_true")
     parser.add_argument(
-        "--test-results", required=True, type=argparse.FileType(), nargs="+"
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to evaluate the results files",
+    )
+    parser.add_argument(
+        "--significance",
+        action="store_true",
+        help="Add bootstrap confidence intervals and compare every pair of models",
+    )
+    parser.add_argument(
+        "--resamples",
+        type=int,
+        default=10_000,
+        help="Number of bootstrap resamples used by --significance",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=0.95,
+        help="Confidence level of the intervals computed by --significance",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the bootstrap resampling",
     )
-    parser.add_argument("--normalise", action="store_true")
     args = parser.parse_args()
 
-    dataset_hashes = {Path(file.name).stem.split("_")[-1] for file in args.test_results}
+    dataset_hashes = {path.stem.split("_")[-1] for path in args.test_results}
     if len(dataset_hashes) == 1:
         _logger.info(
             f"Test set hash validation passed. All datasets contained hash '{list(dataset_hashes)[0]}'"
@@ -43,99 +91,245 @@ def main() -> None:
         )
         return
 
-    _logger.info("Loading metrics 'wer' and 'cer'")
-    metrics = {"wer": evaluate.load("wer"), "cer": evaluate.load("cer")}
-
-    # Splits that we are using (this is slightly cursed)
-    splits: dict[str, Callable[[pl.DataFrame], pl.LazyFrame]] = {
-        "all": lambda results: results.lazy(),
-        "cy": lambda results: results.lazy().filter(pl.col("lang") == "cy"),
-        "en": lambda results: results.lazy().filter(pl.col("lang") == "en"),
-        "read-speech": lambda results: results.lazy().filter(
-            pl.col("speaker").str.starts_with("cvcy")
-        ),
-        "spon-speech": lambda results: results.lazy().filter(
-            ~pl.col("speaker").str.starts_with("cvcy")
-        ),
-        "spon-speech-cy": lambda results: results.lazy().filter(
-            ~pl.col("speaker").str.starts_with("cvcy") & (pl.col("lang") == "cy")
-        ),
-        "spon-speech-en": lambda results: results.lazy().filter(
-            ~pl.col("speaker").str.starts_with("cvcy") & (pl.col("lang") == "en")
-        ),
-        "btb": lambda results: results.lazy().filter(
-            pl.col("speaker").str.starts_with("btb")
-        ),
-        "cvcy": lambda results: results.lazy().filter(
-            pl.col("speaker").str.starts_with("cvcy")
-        ),
-        "lla": lambda results: results.lazy().filter(
-            pl.col("speaker").str.starts_with("lla")
-        ),
-        "lla-en": lambda results: results.lazy().filter(
-            pl.col("speaker").str.starts_with("lla") & (pl.col("lang") == "en")
-        ),
-        "lla-cy": lambda results: results.lazy().filter(
-            pl.col("speaker").str.starts_with("lla") & (pl.col("lang") == "cy")
-        ),
-    }
-
     summary = pl.concat(
-        [
-            get_summary_for_model(
-                test_result, metrics, splits, normalise=args.normalise
-            )
-            for test_result in args.test_results
-        ]
+        evaluate_files(args.test_results, normalise=args.normalise, jobs=args.jobs)
     ).sort(["set", "model"])
+
+    if args.significance:
+        # The alignments have already been cached by the evaluation above
+        alignments = {
+            _model_name(path): load_alignments(path, args.normalise)
+            for path in args.test_results
+        }
+        _logger.info(
+            f"Running {args.resamples} paired bootstrap resamples for {len(alignments)} models"
+        )
+        intervals, comparisons = compare_models(
+            alignments,
+            SPLITS,
+            resamples=args.resamples,
+            confidence=args.confidence,
+            seed=args.seed,
+        )
+        summary = summary.join(
+            intervals, on=["model", "set"], how="left", maintain_order="left"
+        )
+        with pl.Config(tbl_rows=len(comparisons)):
+            _logger.info(comparisons)
+
     _logger.info(summary)
     summary.write_clipboard()
     _logger.info("Table written to clipboard")
 
 
+def evaluate_files(
+    paths: list[Path], normalise: bool = False, jobs: int = 1
+) -> list[pl.DataFrame]:
+    """Returns the summary of every results file, using a pool of worker
+    processes when there is more than one job"""
+    if jobs <= 1 or len(paths) == 1:
+        return [get_summary_for_model(path, SPLITS, normalise) for path in paths]
+
+    with process_pool(min(jobs, len(paths))) as pool:
+        return list(
+            pool.map(
+                get_summary_for_model,
+                paths,
+                [SPLITS] * len(paths),
+                [normalise] * len(paths),
+            )
+        )
+
+
 def get_summary_for_model(
-    file: TextIOWrapper,
-    metrics: dict[str, evaluate.EvaluationModule],
-    splits: dict[str, Callable[[pl.DataFrame], pl.LazyFrame]],
+    path: Path,
+    splits: dict[str, pl.Expr],
     normalise: bool = False,
 ) -> pl.DataFrame:
-    model_name = "_".join(Path(file.name).stem.split("_")[0:-1])
+    model_name = _model_name(path)
     _logger.info(f"Evaluating results for model {model_name}")
 
+    results = load_alignments(path, normalise)
+    summary = results.select(
+        pl.struct(**error_rates(split)).alias(name) for name, split in splits.items()
+    )
+    return pl.concat(
+        [
+            summary.select(pl.col(name).struct.unnest()).insert_column(
+                0, pl.lit(name).alias("set")
+            )
+            for name in splits
+        ]
+    ).insert_column(0, pl.lit(model_name).alias("model"))
+
+
+def load_alignments(path: Path, normalise: bool = False) -> pl.DataFrame:
+    """Loads the results together with the per-utterance error counts.
+
+    The counts are cached in a sidecar file next to the results, keyed by the
+    content of the results file and whether the text was normalised, so only
+    new or changed results have to be aligned"""
+    data = path.read_bytes()
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    variant = "normalised" if normalise else "raw"
+    cache_path = path.parent / ".cache"
+    cache_file = cache_path / f"{path.stem}.v{CACHE_VERSION}.{variant}.{digest}.arrow"
+    if cache_file.exists():
+        _logger.info(f"Using cached alignments from '{cache_file}'")
+        return pl.read_ipc(cache_file, memory_map=False)
+
     # This needs to be moved to the eval script
     results = (
-        pl.read_csv(file)
+        pl.read_csv(data)
         .filter(pl.col("sentence").str.strip_chars() != "")
         .with_columns(pl.col("speaker").str.split("-").first().alias("dataset"))
     )
 
     if normalise:
         results = results.with_columns(
-            pl.col("sentence").map_elements(normalise_sentence, pl.String),
-            pl.col("transcription").map_elements(normalise_sentence, pl.String),
+            normalise_expr("sentence"),
+            normalise_expr("transcription"),
         )
 
-    # print(results)
-    summary = pl.DataFrame(
+    # Align every utterance once, and compute the metrics of the splits from
+    # the counts instead of aligning the utterances of every split again
+    results = pl.concat(
         [
-            {"set": name, **run_evaluation(split(results), metrics)}
-            for name, split in splits.items()
-        ]
-    ).insert_column(0, pl.lit(model_name).alias("model"))
-    return summary
+            results,
+            error_counts(
+                results["transcription"].fill_null("").to_list(),
+                results["sentence"].to_list(),
+            ),
+        ],
+        how="horizontal",
+    ).rechunk()
+
+    # Remove the alignments of older versions of the file before writing the
+    # new ones. Writing to a temporary file first means that other processes
+    # never see a partially written cache
+    cache_path.mkdir(parents=True, exist_ok=True)
+    for stale in cache_path.glob(f"{path.stem}.v*.{variant}.*.arrow"):
+        stale.unlink(missing_ok=True)
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
+    results.write_ipc(tmp_file)
+    os.replace(tmp_file, cache_file)
+    return results
+
 
+def compare_models(
+    alignments: dict[str, pl.DataFrame],
+    splits: dict[str, pl.Expr],
+    resamples: int = 10_000,
+    confidence: float = 0.95,
+    seed: Optional[int] = None,
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    """Paired bootstrap over the per-utterance error counts of the models.
 
-def run_evaluation(
-    data: pl.LazyFrame, metrics: dict[str, evaluate.EvaluationModule]
-) -> dict[str, float]:
-    # Actually collect the data
-    data = data.collect()
-    results = {
-        name: metric.compute(
-            predictions=data["transcription"], references=data["sentence"]
+    Returns the confidence intervals of the WER and CER of every model and
+    split, and the difference between every pair of models with its
+    confidence interval and two-sided p-value"""
+    models = list(alignments)
+    base = next(iter(alignments.values()))
+    counts = base.select(
+        "utterance",
+        "word_reference_length",
+        "char_reference_length",
+        **splits,
+    )
+    for model, results in alignments.items():
+        counts = counts.join(
+            results.select(
+                "utterance",
+                *[
+                    pl.sum_horizontal(
+                        f"{unit}_substitutions",
+                        f"{unit}_deletions",
+                        f"{unit}_insertions",
+                    ).alias(f"{model}/{unit}_errors")
+                    for unit in ["word", "char"]
+                ],
+            ),
+            on="utterance",
+            how="left",
+            maintain_order="left",
         )
-        for name, metric in metrics.items()
+    if counts.null_count().sum_horizontal().item() > 0 or any(
+        len(results) != len(base) for results in alignments.values()
+    ):
+        raise ValueError("The models have not been tested on the same utterances")
+
+    rng = np.random.default_rng(seed)
+    alpha = (1 - confidence) / 2
+    metrics = {"wer": "word", "cer": "char"}
+    intervals, comparisons = [], []
+    for name in splits:
+        split = counts.filter(name)
+        if split.is_empty():
+            continue
+
+        # One column per model and metric, so that every model and metric is
+        # resampled with the same utterances
+        columns = [(metric, model) for metric in metrics for model in models]
+        errors = split.select(
+            f"{model}/{metrics[metric]}_errors" for metric, model in columns
+        ).to_numpy()
+        lengths = split.select(
+            pl.col(f"{metrics[metric]}_reference_length").alias(f"{metric}/{model}")
+            for metric, model in columns
+        ).to_numpy()
+        rates = bootstrap_rates(errors, lengths, resamples, rng)
+        point = errors.sum(axis=0) / lengths.sum(axis=0)
+        low, high = np.quantile(rates, [alpha, 1 - alpha], axis=0)
+
+        for i, model in enumerate(models):
+            row = {"model": model, "set": name}
+            for j, metric in enumerate(metrics):
+                column = j * len(models) + i
+                row[f"{metric}_low"] = low[column]
+                row[f"{metric}_high"] = high[column]
+            intervals.append(row)
+
+        for j, metric in enumerate(metrics):
+            offset = j * len(models)
+            for a, b in combinations(range(len(models)), 2):
+                difference = rates[:, offset + a] - rates[:, offset + b]
+                extreme = min(
+                    np.count_nonzero(difference <= 0),
+                    np.count_nonzero(difference >= 0),
+                )
+                comparisons.append(
+                    {
+                        "set": name,
+                        "metric": metric,
+                        "model_a": models[a],
+                        "model_b": models[b],
+                        "difference": point[offset + a] - point[offset + b],
+                        "low": np.quantile(difference, alpha),
+                        "high": np.quantile(difference, 1 - alpha),
+                        "p_value": min(1.0, 2 * (extreme + 1) / (resamples + 1)),
+                    }
+                )
+
+    interval_schema = {"model": pl.String, "set": pl.String} | {
+        f"{metric}_{end}": pl.Float64 for metric in metrics for end in ["low", "high"]
     }
-    results["uwer"] = word_mean_error_rate(data["transcription"], data["sentence"])
-    results["ucer"] = character_mean_error_rate(data["transcription"], data["sentence"])
-    return results
+    comparison_schema = {
+        "set": pl.String,
+        "metric": pl.String,
+        "model_a": pl.String,
+        "model_b": pl.String,
+        "difference": pl.Float64,
+        "low": pl.Float64,
+        "high": pl.Float64,
+        "p_value": pl.Float64,
+    }
+    return (
+        pl.DataFrame(intervals, schema=interval_schema),
+        pl.DataFrame(comparisons, schema=comparison_schema).sort(
+            ["set", "metric", "model_a", "model_b"]
+        ),
+    )
+
+
+def _model_name(path: Path) -> str:
+    return "_".join(path.stem.split("_")[0:-1])
@@ -1,5 +1,6 @@
 import argparse
 import logging
+import math
 import re
 from pathlib import Path
 from typing import List
@@ -8,7 +9,9 @@ import polars as pl
 from rich.logging import RichHandler
 
 import vosk_cymraeg.datasets.techiaith_text as techiaith_text
-from vosk_cymraeg.normalisation import get_non_domain_chars, normalise_sentence
+from vosk_cymraeg.normalisation import get_non_domain_chars, normalise_expr
+from vosk_cymraeg.parallel import process_pool
+from vosk_cymraeg.phonetics.phone_mapping import load_phone_mapping
 from vosk_cymraeg.phonetics.phonemizer import CyPhonemizer, EnPhonemizer, Phonemizer
 
 URL_PATTERN = re.compile(
@@ -68,7 +71,7 @@ def main() -> None:
                 lambda x: URL_PATTERN.search(x) is None, pl.Boolean
             )
         )
-        .with_columns(pl.col("sentence").map_elements(normalise_sentence, pl.String))
+        .with_columns(normalise_expr("sentence"))
         .filter(pl.col("sentence").map_elements(filter_sentence, pl.Boolean))
     )
     _logger.info(f"The final text corpus contains {len(sentences):,} sentences")
@@ -90,7 +93,7 @@ def main() -> None:
     # We only provide the train dataset to build the text corpus
     build_text_corpus(sentences["sentence"].unique(), output_folder)
 
-    phones = build_lexicon(words, output_folder)
+    phones = build_lexicon(words, output_folder, jobs=args.jobs)
 
     # nonsilence_phones.txt
     nonsilence_phones_path = output_folder / "local/dict_nosp/nonsilence_phones.txt"
@@ -177,6 +180,12 @@ def _get_args() -> argparse.Namespace:
         action="store_true",
         help="Remove enwau audio data from training set",
     )
+    parser.add_argument(
+        "--jobs",
+        default=1,
+        help="Number of worker processes used to build the lexicon",
+        type=int,
+    )
     # parser.add_argument("--output", default="output", help="Target folder for the Kaldi dataset", type=Path)
 
     return parser.parse_args()
@@ -186,9 +195,7 @@ def load_dataset(path: Path, langs: list[str]) -> pl.DataFrame:
     return (
         pl.read_csv(path)
         .filter(pl.col("lang").is_in(langs))
-        .with_columns(
-            pl.col("sentence").map_elements(normalise_sentence, return_dtype=str)
-        )
+        .with_columns(normalise_expr("sentence"))
         .filter(pl.col("sentence").map_elements(filter_sentence, return_dtype=bool))
         .sort("utterance")
     )
@@ -207,7 +214,7 @@ def build_text_corpus(sentences: List[str], output_path: Path) -> None:
             _f.write(f"{s}\n")
 
 
-def build_lexicon(words: pl.DataFrame, output_path: Path) -> None:
+def build_lexicon(words: pl.DataFrame, output_path: Path, jobs: int = 1) -> None:
     """
     Build a lexicon from a list of words
 
@@ -242,47 +249,48 @@ def build_lexicon(words: pl.DataFrame, output_path: Path) -> None:
     output_path.mkdir(exist_ok=True, parents=True)
 
     phone_set = set()
-    phonemizers: dict[str, Phonemizer] = {"cy": CyPhonemizer(), "en": EnPhonemizer()}
-
-    def get_pronunciation(data) -> list[list[str]]:
-        word = data["word"]
-        langs = data["lang"]
-        pronunciations = [
-            pronunciation
-            for lang in langs
-            for pronunciation in phonemizers[lang].phonemize(word)
+
+    # The phone mapping is read once here rather than by every worker
+    phone_mapping = load_phone_mapping()
+
+    # Each language's vocabulary is looked up in bulk, and the pronunciations for
+    # words that appear in several languages are merged afterwards
+    if jobs > 1:
+        frames = _phonemize_in_parallel(words, jobs, phone_mapping)
+    else:
+        _init_phonemizers(phone_mapping)
+        frames = [
+            _phonemize_chunk(lang, group["word"].to_list())
+            for (lang,), group in words.group_by("lang", maintain_order=True)
         ]
+    # There are no frames to concatenate when none of the languages has any words
+    pronunciations = (
+        pl.concat(frames) if frames else pl.DataFrame(schema=PRONUNCIATIONS_SCHEMA)
+    )
 
+    lexicon = (
+        pronunciations.lazy()
+        .explode("pronunciation")
         # Remove empty phones
-        pronunciations = [[char for char in pron if char] for pron in pronunciations]
-        # Remove empty pronunciations
-        pronunciations = [pron for pron in pronunciations if pron]
-        if len(pronunciations) == 0 and "cy" in langs:
-            _logger.warning(f"Failed to phonemize {word!r}")
-
-        return pronunciations
-
-    # We need to group these by the word because we need to
-    # produce all of the pronunciations for the same word
-    # at the same time to make sure that there are no duplicates
-    words = (
-        words.lazy()
-        .group_by("word")
-        .all()
-        .sort("word")
         .with_columns(
-            pl.struct("word", "lang")
-            .map_elements(get_pronunciation, pl.List(pl.List(pl.String)))
-            .alias("pronunciation")
+            pl.col("pronunciation").list.eval(pl.element().filter(pl.element() != ""))
         )
+        # Remove empty pronunciations
         .filter(pl.col("pronunciation").list.len() > 0)
-        .drop("lang")
-        .explode("pronunciation")
         .unique(["word", "pronunciation"])
         .sort("word", pl.col("pronunciation").list.join(" "))
         .collect()
     )
 
+    failed = (
+        words.filter(pl.col("lang") == "cy")
+        .join(lexicon, on="word", how="anti")
+        .unique("word")
+        .sort("word")
+    )
+    for word in failed["word"]:
+        _logger.warning(f"Failed to phonemize {word!r}")
+
     with open(output_path / "lexicon.txt", "w", encoding="utf-8") as _f:
         # Write special phones
         _f.write("!SIL SIL\n<UNK> SPN\n")
@@ -290,13 +298,52 @@ def build_lexicon(words: pl.DataFrame, output_path: Path) -> None:
             _f.write(f"{tag} {special_tags[tag]}\n")
 
         # Write regular words with corresponding phones
-        for word, pronunciation in words.rows():
+        for word, pronunciation in lexicon.rows():
             _f.write(f"{word} {' '.join(pronunciation)}\n")
             phone_set.update(pronunciation)
 
     return phone_set
 
 
+PRONUNCIATIONS_SCHEMA = {
+    "word": pl.String,
+    "pronunciation": pl.List(pl.List(pl.String)),
+}
+
+# Phonemizers for the current process. These are set up once per worker when
+# the lexicon is built in parallel
+_phonemizers: dict[str, Phonemizer] = {}
+
+
+def _init_phonemizers(phone_mapping: dict[str, str]) -> None:
+    if not _phonemizers:
+        _phonemizers.update({"cy": CyPhonemizer(phone_mapping), "en": EnPhonemizer()})
+
+
+def _phonemize_chunk(lang: str, words: list[str]) -> pl.DataFrame:
+    return _phonemizers[lang].phonemize_many(words)
+
+
+def _phonemize_in_parallel(
+    words: pl.DataFrame, jobs: int, phone_mapping: dict[str, str]
+) -> list[pl.DataFrame]:
+    """Splits the word list of each language into chunks and phonemizes them
+    using a pool of worker processes. The workers are given the phone mapping
+    that the parent has already loaded"""
+    chunk_size = max(1, math.ceil(len(words) / (jobs * 4)))
+    langs, chunks = [], []
+    for (lang,), group in words.group_by("lang", maintain_order=True):
+        for i in range(0, len(group), chunk_size):
+            langs.append(lang)
+            chunks.append(group["word"][i : i + chunk_size].to_list())
+
+    _logger.info(f"Phonemizing {len(chunks)} chunks using {jobs} processes")
+    with process_pool(
+        jobs, initializer=_init_phonemizers, initargs=(phone_mapping,)
+    ) as pool:
+        return list(pool.map(_phonemize_chunk, langs, chunks))
+
+
 def build_dataset(name: str, df: pl.DataFrame, output_path: Path) -> None:
     """Generate Kaldi data for one sub-corpus, should be called for each split"""
 
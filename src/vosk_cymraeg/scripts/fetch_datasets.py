@@ -1,19 +1,26 @@
 import argparse
 import logging
+import os
 import shutil
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Callable
 
 from rich.console import Console
 from rich.logging import RichHandler
+from rich.table import Table
 
+from vosk_cymraeg.datasets.audio import BACKENDS
 from vosk_cymraeg.datasets.banc_trawsgrifiadau_bangor import (
     fetch_banc_trawsgrifiadau_bangor,
 )
 from vosk_cymraeg.datasets.common_voice import process_common_voice
 from vosk_cymraeg.datasets.lleisiau_arfor import fetch_lleisiau_arfor
 from vosk_cymraeg.datasets.enwau_cymraeg import fetch_enwau_cymraeg
+from vosk_cymraeg.datasets.progress import DatasetProgress, fetch_progress
+from vosk_cymraeg.parallel import InlineExecutor, process_pool
 
 
 @dataclass
@@ -22,9 +29,10 @@ class Dataset:
 
     name: str
     output_path: Path
-    # A function that takes the target output path
-    # and returns nothing
-    function: Callable[[Path], None]
+    # A function that takes the target output path, the pool of worker
+    # processes that converts the audio, the progress of the dataset, and the
+    # name of the audio backend
+    function: Callable[[Path, Executor, DatasetProgress, str], None]
 
 
 # List of available datasets. The keys are used by argparse
@@ -32,7 +40,9 @@ DATASETS = {
     "cv": Dataset(
         "Common Voice",
         Path("data/interim/cv/cy"),
-        lambda output_path: process_common_voice(Path("data/raw/cv/cy"), output_path),
+        lambda output_path, pool, progress, backend: process_common_voice(
+            Path("data/raw/cv/cy"), output_path, pool, progress, backend
+        ),
     ),
     "btb": Dataset(
         "Banc Trawsgrifiadau Bangor",
@@ -54,20 +64,83 @@ DATASETS = {
 
 def main() -> None:
     """Processes all of the datasets provided in the arguments"""
+    console = Console()
     logging.basicConfig(
-        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+        level="INFO",
+        format="%(message)s",
+        datefmt="[%X]",
+        handlers=[RichHandler(console=console)],
     )
     logger = logging.getLogger(__name__)
     args = _get_args()
-    console = Console()
-    for dataset_id in args.dataset:
+
+    # The datasets are fetched concurrently, and all of them hand their audio
+    # to one pool of --jobs worker processes. A worker that is freed by one
+    # dataset is picked up by the others, and the total is never exceeded. With
+    # a single job the audio is converted in this process instead
+    workers = f"{args.jobs} worker processes" if args.jobs > 1 else "this process"
+    console.rule(f"[bold]Fetching {len(args.dataset)} datasets using {workers}")
+
+    def run(dataset_id: str, pool: Executor, progress: DatasetProgress) -> float:
         dataset = DATASETS[dataset_id]
-        console.rule(f"[bold]{dataset.name}")
-        if args.clear:
-            logger.warning("Clearning the output folder")
-            shutil.rmtree(dataset.output_path)
-        dataset.function(dataset.output_path)
-        console.line()
+        logger.info(f"Starting '{dataset.name}'")
+        start = time.perf_counter()
+        try:
+            if args.clear:
+                logger.warning(f"Clearning the output folder for '{dataset.name}'")
+                shutil.rmtree(dataset.output_path)
+            dataset.function(dataset.output_path, pool, progress, args.audio_backend)
+        except BaseException:
+            progress.finish("[red]failed")
+            raise
+        duration = time.perf_counter() - start
+        progress.finish("[green]done")
+        logger.info(f"Finished '{dataset.name}' in {duration:.0f}s")
+        return duration
+
+    pool = process_pool(args.jobs) if args.jobs > 1 else InlineExecutor()
+    with (
+        fetch_progress(console=console) as display,
+        pool,
+        ThreadPoolExecutor(max_workers=len(args.dataset)) as threads,
+    ):
+        progress = {
+            dataset_id: DatasetProgress(display, DATASETS[dataset_id].name)
+            for dataset_id in args.dataset
+        }
+        futures = {
+            dataset_id: threads.submit(run, dataset_id, pool, progress[dataset_id])
+            for dataset_id in args.dataset
+        }
+
+    # Per-dataset timing summary
+    table = Table(title="Summary")
+    table.add_column("Dataset")
+    table.add_column("Clips", justify="right")
+    table.add_column("Status")
+    table.add_column("Time", justify="right")
+    failed = False
+    for dataset_id, future in futures.items():
+        error = future.exception()
+        if error is None:
+            status, duration = "[green]done", f"{future.result():.0f}s"
+        else:
+            failed = True
+            logger.error(
+                f"Failed to fetch '{DATASETS[dataset_id].name}'", exc_info=error
+            )
+            status, duration = f"[red]failed ({type(error).__name__})", "-"
+        table.add_row(
+            DATASETS[dataset_id].name,
+            f"{progress[dataset_id].completed:,}",
+            status,
+            duration,
+        )
+    console.line()
+    console.print(table)
+
+    if failed:
+        raise SystemExit(1)
 
 
 def _get_args() -> argparse.Namespace:
@@ -79,11 +152,28 @@ def _get_args() -> argparse.Namespace:
     # Used to wipe the output folder before processing
     parser.add_argument("--clear", action="store_true", help="Clears the target folder")
 
-    # Used to select which datasets to processs. Defaults to all of them
+    # Used to select which datasets to processs. Defaults to all of them.
+    # The datasets are fetched concurrently
     parser.add_argument(
         "--dataset",
         nargs="+",
         choices=list(DATASETS.keys()),
         default=list(DATASETS.keys()),
     )
+
+    # Number of processes used to convert the audio
+    parser.add_argument(
+        "--jobs",
+        default=os.cpu_count() or 1,
+        help="Number of worker processes used to convert the audio. The workers are shared by all of the datasets. Defaults to the number of CPUs",
+        type=int,
+    )
+
+    # Backend used to convert the audio, see vosk_cymraeg.datasets.audio
+    parser.add_argument(
+        "--audio-backend",
+        choices=list(BACKENDS.keys()),
+        default="auto",
+        help="How the audio is converted. 'soundfile' converts it in-process, 'sox' runs the sox binary for every clip, and 'auto' uses soundfile and falls back to sox for files that soundfile cannot decode",
+    )
     return parser.parse_args()
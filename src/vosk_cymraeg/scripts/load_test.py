@@ -0,0 +1,222 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+import wave
+from datetime import datetime
+from pathlib import Path
+
+import polars as pl
+from rich import print
+from rich.logging import RichHandler
+from rich.table import Table
+from tqdm import tqdm
+from websockets.asyncio.client import connect
+from websockets.exceptions import ConnectionClosed, InvalidHandshake, InvalidURI
+
+from vosk_cymraeg.scripts.serve import TRY_AGAIN_LATER
+
+_logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    args = parse_args()
+
+    dataset = pl.read_csv(args.test_data)
+    if args.limit is not None:
+        dataset = dataset.head(args.limit)
+
+    _logger.info(
+        f"Replaying {len(dataset)} utterances to '{args.uri}' using {args.concurrency} concurrent clients"
+    )
+    start = time.perf_counter()
+    records = asyncio.run(
+        replay(
+            args.uri,
+            dataset["path"].to_list(),
+            args.concurrency,
+            args.chunk_ms,
+            args.speed,
+        )
+    )
+    wall_time = time.perf_counter() - start
+
+    results = pl.DataFrame(
+        records, schema_overrides={"chunk_latencies": pl.List(pl.Float64)}
+    ).with_columns(utterance=dataset["utterance"], speaker=dataset["speaker"])
+    summary = summarise(results, wall_time, args.concurrency)
+    print(_summary_table(summary))
+
+    output_path: Path = args.output
+    if output_path is None:
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output_path = Path("results/load_tests") / f"load_test_{timestamp}"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    results.with_columns(
+        chunk_latency_mean=pl.col("chunk_latencies").list.mean(),
+        chunk_latency_max=pl.col("chunk_latencies").list.max(),
+    ).drop("chunk_latencies").write_csv(output_path.with_suffix(".csv"))
+    output_path.with_suffix(".json").write_text(
+        json.dumps(
+            {
+                "uri": args.uri,
+                "test_data": str(args.test_data),
+                "chunk_ms": args.chunk_ms,
+                "speed": args.speed,
+                "summary": summary,
+            },
+            indent=2,
+        )
+    )
+    _logger.info(f"Wrote the results to '{output_path.with_suffix('.json')}'")
+
+
+async def replay(
+    uri: str, paths: list[str], concurrency: int, chunk_ms: int, speed: float
+) -> list[dict]:
+    """Streams the files to the server using a fixed number of concurrent
+    clients. Returns one record per file in the same order as the paths"""
+    records: list[dict] = [{}] * len(paths)
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(len(paths)):
+        queue.put_nowait(i)
+
+    with tqdm(desc="Streaming", total=len(paths)) as pbar:
+
+        async def client() -> None:
+            while not queue.empty():
+                i = queue.get_nowait()
+                records[i] = await stream_file(uri, paths[i], chunk_ms, speed)
+                pbar.update(1)
+
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+    return records
+
+
+async def stream_file(uri: str, path: str, chunk_ms: int, speed: float) -> dict:
+    """Streams one file to the server at the pace it would have been recorded"""
+    with wave.open(path) as wf:
+        sample_rate = wf.getframerate()
+        chunk_frames = max(1, sample_rate * chunk_ms // 1000)
+        audio_seconds = wf.getnframes() / sample_rate
+        chunks = list(iter(lambda: wf.readframes(chunk_frames), b""))
+
+    record = {
+        "audio_seconds": audio_seconds,
+        "status": "ok",
+        "chunk_latencies": [],
+        "final_latency": None,
+        "transcription": None,
+    }
+    latencies = record["chunk_latencies"]
+    results = []
+    try:
+        async with connect(uri) as websocket:
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            for i, chunk in enumerate(chunks):
+                # Wait until the chunk has been "recorded"
+                delay = start + (i + 1) * chunk_frames / sample_rate / speed
+                await asyncio.sleep(max(0.0, delay - loop.time()))
+
+                sent = time.perf_counter()
+                await websocket.send(chunk)
+                result = json.loads(await websocket.recv())
+                latencies.append(time.perf_counter() - sent)
+                if "text" in result:
+                    results.append(result["text"])
+
+            sent = time.perf_counter()
+            await websocket.send('{"eof" : 1}')
+            results.append(json.loads(await websocket.recv())["text"])
+            record["final_latency"] = time.perf_counter() - sent
+    except ConnectionClosed as e:
+        rejected = e.rcvd is not None and e.rcvd.code == TRY_AGAIN_LATER
+        record["status"] = "rejected" if rejected else "closed"
+        return record
+    # Before OSError, which the built-in TimeoutError is a subclass of
+    except (asyncio.TimeoutError, TimeoutError):
+        record["status"] = "timeout"
+        return record
+    except (InvalidHandshake, InvalidURI, OSError) as e:
+        record["status"] = f"error ({e.__class__.__name__})"
+        return record
+
+    record["transcription"] = " ".join(text for text in results if text)
+    return record
+
+
+def summarise(results: pl.DataFrame, wall_time: float, concurrency: int) -> dict:
+    ok = results.filter(pl.col("status") == "ok")
+    audio_seconds = ok["audio_seconds"].sum()
+    chunk_latencies = ok["chunk_latencies"].explode()
+    return {
+        "concurrency": concurrency,
+        "utterances": len(results),
+        "succeeded": len(ok),
+        "rejected": results.filter(pl.col("status") == "rejected").height,
+        "failed": results.filter(~pl.col("status").is_in(["ok", "rejected"])).height,
+        "wall_seconds": wall_time,
+        "audio_seconds": audio_seconds,
+        "audio_seconds_per_second": audio_seconds / wall_time,
+        "chunk_latency_p50": chunk_latencies.median(),
+        "chunk_latency_p90": chunk_latencies.quantile(0.9),
+        "chunk_latency_p99": chunk_latencies.quantile(0.99),
+        "final_latency_p50": ok["final_latency"].median(),
+        "final_latency_p90": ok["final_latency"].quantile(0.9),
+        "final_latency_p99": ok["final_latency"].quantile(0.99),
+    }
+
+
+def _summary_table(summary: dict) -> Table:
+    table = Table(title="Load test")
+    table.add_column("Metric")
+    table.add_column("Value", justify="right")
+    for key, value in summary.items():
+        table.add_row(
+            key.replace("_", " ").capitalize(),
+            f"{value:.3f}" if isinstance(value, float) else str(value),
+        )
+    return table
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        "load-test",
+        description="Script responsible for replaying a test set through the 'serve' WebSocket server",
+    )
+    parser.add_argument("--uri", default="ws://localhost:2700")
+    parser.add_argument("--test-data", required=True, type=Path)
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Number of clients streaming at the same time",
+    )
+    parser.add_argument(
+        "--chunk-ms",
+        type=int,
+        default=200,
+        help="Size of the audio chunks sent to the server in milliseconds",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="How much faster than real time each client sends its audio",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="Only use the first N utterances of the test data",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Where to write the results. The .json and .csv extensions are added automatically",
+    )
+    return parser.parse_args()
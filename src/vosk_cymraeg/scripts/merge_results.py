@@ -0,0 +1,107 @@
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+
+import polars as pl
+from rich.logging import RichHandler
+
+_logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    args = parse_args()
+
+    shards_path: Path = args.shards
+    metadata = [
+        json.loads(path.read_text())
+        for path in sorted(shards_path.glob("shard-*.json"))
+    ]
+    if not metadata:
+        _logger.error(f"Found no finished shards in '{shards_path}'")
+        return
+
+    # All of the shards must come from the same model, test set and split
+    for key in ["model", "dataset_hash", "dataset_size", "count"]:
+        values = {str(shard[key]) for shard in metadata}
+        if len(values) > 1:
+            _logger.error(
+                f"The shards disagree on '{key}' ({', '.join(sorted(values))}). Only shards from the same run can be merged"
+            )
+            return
+    model, dataset_hash, count = (
+        metadata[0]["model"],
+        metadata[0]["dataset_hash"],
+        metadata[0]["count"],
+    )
+
+    missing = sorted(set(range(1, count + 1)) - {shard["index"] for shard in metadata})
+    if missing:
+        _logger.error(
+            f"Shard(s) {', '.join(f'{index}/{count}' for index in missing)} are missing or unfinished"
+        )
+        return
+
+    dataset = pl.read_csv(args.test_data)
+    if f"{dataset.hash_rows().sum():x}" != dataset_hash:
+        _logger.error(
+            f"The hash of '{args.test_data}' does not match the hash of the tested dataset '{dataset_hash}'"
+        )
+        return
+
+    shards = pl.concat(
+        [
+            pl.read_csv(
+                shards_path / f"shard-{index}-of-{count}.csv",
+                schema_overrides={"transcription": pl.String},
+            ).select("utterance", "transcription")
+            for index in range(1, count + 1)
+        ]
+    )
+    if len(shards) != len(dataset):
+        _logger.error(
+            f"The shards contain {len(shards)} utterances, but the test set contains {len(dataset)}"
+        )
+        return
+
+    # Put the transcriptions back into the order of the test set
+    results = dataset.join(shards, on="utterance", how="left", maintain_order="left")
+    if results["transcription"].null_count() > 0:
+        _logger.error("The shards do not cover every utterance of the test set")
+        return
+
+    results_path = shards_path.parent / f"{model}_{dataset_hash}.csv"
+    if results_path.exists():
+        _logger.error(
+            f"The file '{results_path}' already exist. To merge the shards again, please delete this file"
+        )
+        return
+
+    tmp_path = results_path.with_name(results_path.name + ".tmp")
+    results.write_csv(tmp_path)
+    os.replace(tmp_path, results_path)
+    _logger.info(f"Merged {count} shards into '{results_path}'")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        "merge",
+        description="Script responsible for merging the shards produced by 'test --shard'",
+    )
+    parser.add_argument(
+        "--shards",
+        required=True,
+        type=Path,
+        help="The folder containing the shards (e.g. results/<model>_<hash>)",
+    )
+    parser.add_argument(
+        "--test-data",
+        required=True,
+        type=Path,
+        help="The full test set. Used to verify the shards and to restore the order of the utterances",
+    )
+    return parser.parse_args()
@@ -0,0 +1,70 @@
+import argparse
+import difflib
+import logging
+import sys
+
+from rich.logging import RichHandler
+
+from vosk_cymraeg.phonetics.phone_mapping import (
+    CHECKSUM_PATH,
+    MAPPING_PATH,
+    MAPPING_URL,
+    checksum,
+    fetch_phone_mapping,
+    parse_phone_mapping,
+    read_checksum,
+    write_phone_mapping,
+)
+
+_logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    """Re-downloads the llef -> Bangor phone mapping and updates the vendored snapshot"""
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    args = _get_args()
+
+    _logger.info(f"Downloading phone mapping from {MAPPING_URL}")
+    new_text = fetch_phone_mapping()
+    # Make sure that the new version can actually be used before going any further
+    parse_phone_mapping(new_text)
+
+    old_text = MAPPING_PATH.read_text(encoding="utf-8") if MAPPING_PATH.exists() else ""
+    old_checksum = read_checksum() if CHECKSUM_PATH.exists() else None
+    new_checksum = checksum(new_text.encode("utf-8"))
+
+    diff = list(
+        difflib.unified_diff(
+            old_text.splitlines(keepends=True),
+            new_text.splitlines(keepends=True),
+            fromfile=f"{MAPPING_PATH.name} ({old_checksum or 'missing'})",
+            tofile=f"{MAPPING_PATH.name} ({new_checksum})",
+        )
+    )
+    if not diff and old_checksum == new_checksum:
+        _logger.info(f"The vendored phone mapping is up to date ({new_checksum})")
+        return
+
+    sys.stdout.writelines(diff)
+
+    if args.check:
+        _logger.error("The vendored phone mapping is out of date")
+        sys.exit(1)
+
+    write_phone_mapping(new_text)
+    _logger.info(f"Updated '{MAPPING_PATH}' ({old_checksum} -> {new_checksum})")
+
+
+def _get_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        "refresh",
+        description="Script responsible for updating the vendored llef -> Bangor phone mapping",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Only show the difference and exit with an error if the snapshot is out of date",
+    )
+    return parser.parse_args()
@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from http import HTTPStatus
+from pathlib import Path
+from typing import Optional
+
+from rich.logging import RichHandler
+from vosk import KaldiRecognizer, SetLogLevel
+from websockets.asyncio.server import ServerConnection, serve
+from websockets.exceptions import ConnectionClosed
+from websockets.http11 import Request, Response
+
+from vosk_cymraeg.asr import SAMPLE_RATE, RecogniserPool
+
+_logger = logging.getLogger(__name__)
+
+# Close code telling the client to try again later (RFC 6455)
+TRY_AGAIN_LATER = 1013
+
+
+def main() -> None:
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    args = parse_args()
+    SetLogLevel(-1)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        _logger.info("Shutting down")
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    _logger.info(f"Loading model '{args.model}'")
+    server = StreamingServer(
+        RecogniserPool(args.model, size=args.max_sessions), args.queue_timeout
+    )
+    async with serve(
+        server.handle,
+        args.host,
+        args.port,
+        process_request=server.process_request,
+        max_size=args.max_message_size,
+    ) as ws_server:
+        _logger.info(
+            f"Listening on ws://{args.host}:{args.port} with up to {args.max_sessions} concurrent sessions. Counters are available at http://{args.host}:{args.port}/metrics"
+        )
+        if args.stats_interval > 0:
+            asyncio.get_running_loop().create_task(
+                server.log_stats(args.stats_interval)
+            )
+        await ws_server.serve_forever()
+
+
+class Stats:
+    """Throughput and latency counters for the server. The latencies are kept
+    for the most recent chunks and sessions only"""
+
+    def __init__(self, window: int = 10_000):
+        self.started = time.monotonic()
+        self.active_sessions = 0
+        self.total_sessions = 0
+        self.rejected_sessions = 0
+        self.chunks = 0
+        self.audio_seconds = 0.0
+        self.chunk_latencies: deque[float] = deque(maxlen=window)
+        self.final_latencies: deque[float] = deque(maxlen=window)
+
+    def snapshot(self) -> dict:
+        uptime = time.monotonic() - self.started
+        return {
+            "uptime_seconds": uptime,
+            "active_sessions": self.active_sessions,
+            "total_sessions": self.total_sessions,
+            "rejected_sessions": self.rejected_sessions,
+            "chunks": self.chunks,
+            "audio_seconds": self.audio_seconds,
+            "audio_seconds_per_second": self.audio_seconds / uptime,
+            "chunk_latency_p50": _percentile(self.chunk_latencies, 0.5),
+            "chunk_latency_p90": _percentile(self.chunk_latencies, 0.9),
+            "chunk_latency_p99": _percentile(self.chunk_latencies, 0.99),
+            "final_latency_p50": _percentile(self.final_latencies, 0.5),
+            "final_latency_p90": _percentile(self.final_latencies, 0.9),
+            "final_latency_p99": _percentile(self.final_latencies, 0.99),
+        }
+
+
+class StreamingServer:
+    """Streams audio from WebSocket clients to a pool of recognisers.
+
+    The clients send 16-bit mono PCM at 16kHz as binary messages and get the
+    partial or final result for every chunk back as JSON. Sending the text
+    message '{"eof" : 1}' finishes the utterance and returns the final result.
+
+    Every session holds one recogniser from the pool, so the size of the pool
+    caps the number of concurrent sessions. Clients that can not get a
+    recogniser within the queue timeout are disconnected with code 1013 (try
+    again later). Each session only reads the next chunk once the previous one
+    has been decoded, so clients sending faster than the model can decode are
+    slowed down by the WebSocket flow control instead of buffering audio"""
+
+    def __init__(self, pool: RecogniserPool, queue_timeout: float = 5.0):
+        self.pool = pool
+        self.queue_timeout = queue_timeout
+        self.stats = Stats()
+        self._slots = asyncio.Semaphore(pool.size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=pool.size, thread_name_prefix="decoder"
+        )
+
+    async def handle(self, websocket: ServerConnection) -> None:
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.stats.rejected_sessions += 1
+            await websocket.close(TRY_AGAIN_LATER, "Too many concurrent sessions")
+            return
+
+        decoder = _Decoder(self._executor, self.pool.checkout(timeout=0))
+        self.stats.active_sessions += 1
+        self.stats.total_sessions += 1
+        try:
+            await self._session(websocket, decoder)
+        except ConnectionClosed:
+            pass
+        finally:
+            self.stats.active_sessions -= 1
+            in_flight = decoder.in_flight
+            if in_flight is None or in_flight.done():
+                self._release(decoder.recogniser)
+            else:
+                # The session was cancelled while the recogniser was decoding.
+                # Checking it in resets it, so that has to wait until the
+                # decoder thread is done with it
+                loop = asyncio.get_running_loop()
+                in_flight.add_done_callback(
+                    lambda _: loop.call_soon_threadsafe(
+                        self._release, decoder.recogniser
+                    )
+                )
+
+    def _release(self, recogniser: KaldiRecognizer) -> None:
+        self.pool.checkin(recogniser)
+        self._slots.release()
+
+    async def _session(self, websocket: ServerConnection, decoder: "_Decoder") -> None:
+        async for message in websocket:
+            start = time.perf_counter()
+            if isinstance(message, str):
+                try:
+                    control = json.loads(message)
+                except json.JSONDecodeError:
+                    _logger.debug(
+                        f"Ignoring a text message that is not JSON: {message!r}"
+                    )
+                    continue
+                if not isinstance(control, dict) or "eof" not in control:
+                    continue
+                result = await decoder(_final_result)
+                await websocket.send(result)
+                self.stats.final_latencies.append(time.perf_counter() - start)
+                return
+
+            result = await decoder(_accept_waveform, message)
+            await websocket.send(result)
+            self.stats.chunks += 1
+            self.stats.audio_seconds += len(message) / (2 * SAMPLE_RATE)
+            self.stats.chunk_latencies.append(time.perf_counter() - start)
+
+    def process_request(
+        self, connection: ServerConnection, request: Request
+    ) -> Optional[Response]:
+        """Serves the counters over plain HTTP next to the WebSocket endpoint"""
+        if request.path == "/metrics":
+            return connection.respond(
+                HTTPStatus.OK, json.dumps(self.stats.snapshot()) + "\n"
+            )
+        return None
+
+    async def log_stats(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            stats = self.stats.snapshot()
+            _logger.info(
+                f"{stats['active_sessions']} active sessions, {stats['total_sessions']} total, {stats['rejected_sessions']} rejected. "
+                f"{stats['audio_seconds_per_second']:.2f} audio seconds per second. "
+                f"Chunk latency p50 {stats['chunk_latency_p50']:.3f}s, p99 {stats['chunk_latency_p99']:.3f}s"
+            )
+
+
+class _Decoder:
+    """Runs the calls on the recogniser of a session in the executor, and keeps
+    track of the call that is in flight"""
+
+    def __init__(self, executor: ThreadPoolExecutor, recogniser: KaldiRecognizer):
+        self.recogniser = recogniser
+        self.in_flight: Optional[Future] = None
+        self._executor = executor
+
+    async def __call__(self, function, *args) -> str:
+        self.in_flight = self._executor.submit(function, self.recogniser, *args)
+        return await asyncio.wrap_future(self.in_flight)
+
+
+def _final_result(recogniser: KaldiRecognizer) -> str:
+    return recogniser.FinalResult()
+
+
+def _accept_waveform(recogniser: KaldiRecognizer, data: bytes) -> str:
+    if recogniser.AcceptWaveform(data):
+        return recogniser.Result()
+    return recogniser.PartialResult()
+
+
+def _percentile(values: deque[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        "serve",
+        description="WebSocket server that streams audio to a Vosk model",
+    )
+    parser.add_argument("--model", required=True, type=Path)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=2700)
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        default=4,
+        help="Maximum number of concurrent sessions (and recognisers)",
+    )
+    parser.add_argument(
+        "--queue-timeout",
+        type=float,
+        default=5.0,
+        help="Seconds a new session waits for a free recogniser before being turned away",
+    )
+    parser.add_argument(
+        "--max-message-size",
+        type=int,
+        default=2**20,
+        help="Maximum size of a single audio chunk in bytes",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=30.0,
+        help="Seconds between logging the counters. Set to 0 to disable",
+    )
+    return parser.parse_args()
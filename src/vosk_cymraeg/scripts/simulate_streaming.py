@@ -0,0 +1,271 @@
+import argparse
+import json
+import logging
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List
+
+import polars as pl
+from rich import print
+from rich.logging import RichHandler
+from rich.table import Table
+from tqdm import tqdm
+from vosk import KaldiRecognizer, Model, SetLogLevel
+
+from vosk_cymraeg.asr import RecogniserPool
+
+_logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    args = parse_args()
+
+    dataset = pl.read_csv(args.test_data)
+    if args.limit is not None:
+        dataset = dataset.head(args.limit)
+
+    SetLogLevel(-1)
+    _logger.info(f"Loading model '{args.model}'")
+    model = Model(str(args.model))
+
+    streams = []
+    for chunk_ms in args.chunk_ms:
+        streams.append(
+            simulate_streams(
+                model,
+                dataset["path"].to_list(),
+                chunk_ms,
+                speed=args.speed,
+                jobs=args.jobs,
+            ).with_columns(
+                speaker=dataset["speaker"],
+                utterance=dataset["utterance"],
+                chunk_ms=pl.lit(chunk_ms),
+            )
+        )
+    results = pl.concat(streams)
+
+    summary = summarise(results)
+    print(_summary_table(summary))
+
+    output_path: Path = args.output
+    if output_path is None:
+        timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output_path = Path("results/streaming") / f"{args.model.name}_{timestamp}"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    results.write_csv(output_path.with_suffix(".csv"))
+    output_path.with_suffix(".json").write_text(
+        json.dumps(
+            {
+                "model": args.model.name,
+                "test_data": str(args.test_data),
+                "speed": args.speed,
+                "summary": summary.to_dicts(),
+            },
+            indent=2,
+        )
+    )
+    _logger.info(f"Wrote the results to '{output_path.with_suffix('.json')}'")
+
+
+def simulate_streams(
+    model: Model, paths: List[str], chunk_ms: int, speed: float = 1.0, jobs: int = 1
+) -> pl.DataFrame:
+    """Streams every file through a recogniser at the pace it would have been
+    recorded, using one thread per concurrent stream. Returns one row per file
+    in the same order as the paths"""
+    recognisers = RecogniserPool(model, size=jobs)
+
+    def stream(path: str) -> dict:
+        with recognisers.recogniser() as recogniser:
+            return simulate_stream(recogniser, path, chunk_ms, speed)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        records = list(
+            tqdm(
+                pool.map(stream, paths),
+                desc=f"Streaming ({chunk_ms} ms chunks)",
+                total=len(paths),
+            )
+        )
+    return pl.DataFrame(records)
+
+
+def simulate_stream(
+    recogniser: KaldiRecognizer, input_path: str, chunk_ms: int, speed: float = 1.0
+) -> dict:
+    """Feeds the file to the recogniser one chunk at a time, waiting until each
+    chunk would have been captured by a microphone before sending it.
+
+    All latencies are given in seconds. The time to the first partial result
+    is measured from the start of the stream and is scaled back to real time
+    when the audio is played faster than real time. The finalisation latency
+    is measured from the moment the last chunk is sent (i.e. the end of
+    speech) until the final result is available."""
+    with wave.open(input_path) as wf:
+        sample_rate = wf.getframerate()
+        audio_seconds = wf.getnframes() / sample_rate
+        chunk_frames = max(1, sample_rate * chunk_ms // 1000)
+        chunk_seconds = chunk_frames / sample_rate
+
+        first_partial = None
+        partial_updates = 0
+        retracted_words = 0
+        previous: List[str] = []
+        results = []
+
+        start = time.perf_counter()
+        sent_seconds = 0.0
+        while True:
+            data = wf.readframes(chunk_frames)
+            if len(data) == 0:
+                break
+
+            # Wait until the chunk has been "recorded"
+            sent_seconds += chunk_seconds
+            delay = start + sent_seconds / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            if recogniser.AcceptWaveform(data):
+                results.append(json.loads(recogniser.Result())["text"])
+                if first_partial is None and results[-1]:
+                    first_partial = (time.perf_counter() - start) * speed
+                previous = []
+                continue
+
+            partial = json.loads(recogniser.PartialResult())["partial"].split()
+            if partial == previous:
+                continue
+            if first_partial is None and partial:
+                first_partial = (time.perf_counter() - start) * speed
+            partial_updates += 1
+            # Count the words of the previous hypothesis that were changed or
+            # removed rather than just extended
+            retracted_words += len(previous) - _common_prefix_length(previous, partial)
+            previous = partial
+
+        end_of_speech = time.perf_counter()
+        results.append(json.loads(recogniser.FinalResult())["text"])
+        finalisation_latency = time.perf_counter() - end_of_speech
+
+    recogniser.Reset()
+    transcription = " ".join(results).strip()
+    return {
+        "audio_seconds": audio_seconds,
+        "first_partial_seconds": first_partial,
+        "finalisation_seconds": finalisation_latency,
+        "partial_updates": partial_updates,
+        "retracted_words": retracted_words,
+        "words": len(transcription.split()),
+        "transcription": transcription,
+    }
+
+
+def summarise(results: pl.DataFrame) -> pl.DataFrame:
+    """Aggregates the per-utterance measurements for the whole test set and for
+    every dataset (based on the speaker ID prefix)"""
+    aggregations = [
+        pl.len().alias("utterances"),
+        pl.col("first_partial_seconds").median().alias("first_partial_p50"),
+        pl.col("first_partial_seconds").quantile(0.9).alias("first_partial_p90"),
+        pl.col("finalisation_seconds").median().alias("finalisation_p50"),
+        pl.col("finalisation_seconds").quantile(0.9).alias("finalisation_p90"),
+        pl.col("finalisation_seconds").quantile(0.99).alias("finalisation_p99"),
+        (pl.col("partial_updates").sum() / pl.col("audio_seconds").sum()).alias(
+            "partials_per_second"
+        ),
+        # The share of the final words that had to be retracted along the way
+        (pl.col("retracted_words").sum() / pl.col("words").sum()).alias("instability"),
+    ]
+    results = results.with_columns(
+        dataset=pl.col("speaker").str.split("-").list.first()
+    )
+    return pl.concat(
+        [
+            results.group_by("chunk_ms")
+            .agg(aggregations)
+            .with_columns(dataset=pl.lit("all")),
+            results.group_by("chunk_ms", "dataset").agg(aggregations),
+        ],
+        how="diagonal",
+    ).sort("chunk_ms", pl.col("dataset") != "all", "dataset")
+
+
+def _common_prefix_length(a: List[str], b: List[str]) -> int:
+    length = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        length += 1
+    return length
+
+
+def _summary_table(summary: pl.DataFrame) -> Table:
+    table = Table(title="Streaming")
+    columns = {
+        "chunk_ms": "Chunk (ms)",
+        "dataset": "Dataset",
+        "utterances": "Utterances",
+        "first_partial_p50": "First partial p50 (s)",
+        "first_partial_p90": "First partial p90 (s)",
+        "finalisation_p50": "Final p50 (s)",
+        "finalisation_p90": "Final p90 (s)",
+        "finalisation_p99": "Final p99 (s)",
+        "instability": "Instability",
+    }
+    for name in columns.values():
+        table.add_column(name, justify="left" if name == "Dataset" else "right")
+    for row in summary.select(columns.keys()).iter_rows():
+        table.add_row(
+            *[
+                f"{value:.3f}" if isinstance(value, float) else str(value)
+                for value in row
+            ]
+        )
+    return table
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        "simulate",
+        description="Script responsible for measuring how a model behaves when streaming audio in real time",
+    )
+    parser.add_argument("--model", required=True, type=Path)
+    parser.add_argument("--test-data", required=True, type=Path)
+    parser.add_argument(
+        "--chunk-ms",
+        type=int,
+        nargs="+",
+        default=[200],
+        help="The sizes of the audio chunks sent to the recogniser in milliseconds",
+    )
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="How much faster than real time to play the audio. The time to the first partial is scaled back to real time",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of streams to simulate concurrently",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        help="Only use the first N utterances of the test data",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="Where to write the results. The .json and .csv extensions are added automatically",
+    )
+    return parser.parse_args()
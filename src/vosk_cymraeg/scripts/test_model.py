@@ -1,10 +1,12 @@
 import argparse
 import json
 import logging
+import math
 import os
 import wave
+import zlib
 from pathlib import Path
-from typing import Optional
+from typing import Iterable, Iterator, List, Optional
 
 import datasets
 import dotenv
@@ -14,15 +16,10 @@ from rich.logging import RichHandler
 from tqdm import tqdm
 from vosk import KaldiRecognizer, Model
 
-_logger = logging.getLogger(__name__)
-
+from vosk_cymraeg.asr import CHUNK_FRAMES, decode
+from vosk_cymraeg.parallel import can_fork, process_pool
 
-def w_pbar(pbar, func):
-    def foo(*args, **kwargs):
-        pbar.update(1)
-        return func(*args, **kwargs)
-
-    return foo
+_logger = logging.getLogger(__name__)
 
 
 def main() -> None:
@@ -31,6 +28,12 @@ def main() -> None:
     )
     args = parse_args()
 
+    if args.publish and args.shard is not None:
+        _logger.error(
+            "--publish can not be combined with --shard. Merge the shards with 'merge' first"
+        )
+        return
+
     publish_path: Optional[str] = args.publish_path
     if args.publish:
         _logger.info(
@@ -55,6 +58,14 @@ def main() -> None:
     )
 
     results_path: Path = Path("results/") / f"{args.model.name}_{dataset_hash:x}.csv"
+    if args.shard is not None:
+        index, count = args.shard
+        full_dataset = dataset
+        dataset = select_shard(dataset, index, count)
+        results_path = shard_path(results_path, index, count)
+        _logger.info(
+            f"Testing shard {index}/{count} containing {len(dataset)} of {len(full_dataset)} utterances"
+        )
     results_path.parent.mkdir(parents=True, exist_ok=True)
 
     _logger.info(
@@ -68,23 +79,43 @@ def main() -> None:
         )
         return
 
+    # The transcriptions are written to the partial file as they are finished so
+    # that an interrupted run can be resumed by running the same command again
+    partial_path = results_path.with_name(results_path.name + ".partial")
+    done = read_checkpoint(partial_path)
+    if len(done) > 0:
+        _logger.info(
+            f"Resuming from '{partial_path}'. {len(done)} utterances have already been transcribed"
+        )
+    remaining = dataset.filter(~pl.col("utterance").is_in(done["utterance"].implode()))
+
     print(dataset)
-    print("Loading model")
-    model = Model(str(args.model))
-    with tqdm(desc="Transcribing files", total=len(dataset)) as pbar:
-        dataset = dataset.with_columns(
-            pl.col("path")
-            .map_elements(
-                w_pbar(
-                    pbar,
-                    lambda path: transcribe_file(KaldiRecognizer(model, 16_000), path),
-                ),
-                pl.String,
-            )
-            .alias("transcription")
+    with tqdm(
+        desc="Transcribing files",
+        total=len(dataset),
+        initial=len(dataset) - len(remaining),
+    ) as pbar:
+        write_checkpoint(
+            partial_path,
+            remaining["utterance"].to_list(),
+            transcribe_files(args.model, remaining["path"].to_list(), args.jobs),
+            args.checkpoint_every,
+            pbar,
         )
 
-    dataset.write_csv(results_path)
+    dataset = finalise_results(dataset, partial_path, results_path)
+
+    if args.shard is not None:
+        write_shard_metadata(
+            results_path,
+            model=args.model.name,
+            test_data=args.test_data,
+            dataset_hash=dataset_hash,
+            dataset_size=len(full_dataset),
+            index=index,
+            count=count,
+            utterances=len(dataset),
+        )
 
     if args.publish:
         _logger.info(f"Publishing dataset to {publish_path}")
@@ -97,28 +128,161 @@ def main() -> None:
         )
 
 
+def select_shard(dataset: pl.DataFrame, index: int, count: int) -> pl.DataFrame:
+    """Returns the rows of the shard with the given (1-based) index.
+
+    The rows are assigned to shards using the CRC32 of their utterance ID, which
+    unlike the hash functions of Python and polars is the same on every machine
+    and version"""
+    shards = pl.Series(
+        [
+            zlib.crc32(utterance.encode("utf-8")) % count
+            for utterance in dataset["utterance"]
+        ],
+        dtype=pl.Int64,
+    )
+    return dataset.filter(shards == index - 1)
+
+
+def shard_path(results_path: Path, index: int, count: int) -> Path:
+    """Shards are written to a folder named after the results file they belong to"""
+    return results_path.with_suffix("") / f"shard-{index}-of-{count}.csv"
+
+
+def write_shard_metadata(results_path: Path, **metadata) -> None:
+    metadata["dataset_hash"] = f"{metadata['dataset_hash']:x}"
+    metadata["test_data"] = str(metadata["test_data"])
+    results_path.with_suffix(".json").write_text(json.dumps(metadata, indent=2))
+
+
+def transcribe_files(
+    model_path: Path, paths: List[str], jobs: int = 1
+) -> Iterator[str]:
+    """Transcribes the files and yields the transcriptions in the same order as
+    the paths, regardless of the number of jobs"""
+    if not paths:
+        return
+    if jobs <= 1:
+        print("Loading model")
+        _init_worker(model_path)
+        for path in paths:
+            yield _transcribe_worker(path)
+        return
+
+    # Unlike the other pools the workers are forked where possible, so that the
+    # model is loaded once here and shared copy-on-write with them. Elsewhere
+    # every worker loads its own copy. Forking is safe since the workers only
+    # decode audio with vosk and never use Polars
+    if can_fork():
+        print("Loading model")
+        _init_worker(model_path, create_recogniser=False)
+
+    chunk_size = max(1, math.ceil(len(paths) / (jobs * 16)))
+    with process_pool(
+        jobs, initializer=_init_worker, initargs=(model_path,), fork=True
+    ) as pool:
+        # map() yields the results in the order of the inputs
+        yield from pool.map(_transcribe_worker, paths, chunksize=chunk_size)
+
+
+CHECKPOINT_SCHEMA = {"utterance": pl.String, "transcription": pl.String}
+
+
+def read_checkpoint(path: Path) -> pl.DataFrame:
+    """Reads the transcriptions that have been written to the partial file"""
+    if not path.exists():
+        return pl.DataFrame(schema=CHECKPOINT_SCHEMA)
+
+    # If the previous run was killed while writing, drop the incomplete line
+    data = path.read_bytes()
+    if data and not data.endswith(b"\n"):
+        data = data[: data.rfind(b"\n") + 1]
+        path.write_bytes(data)
+    if not data:
+        return pl.DataFrame(schema=CHECKPOINT_SCHEMA)
+
+    return pl.read_csv(path, schema=CHECKPOINT_SCHEMA).unique(
+        "utterance", keep="last", maintain_order=True
+    )
+
+
+def write_checkpoint(
+    path: Path,
+    utterances: List[str],
+    transcriptions: Iterable[str],
+    chunk_size: int,
+    pbar: Optional[tqdm] = None,
+) -> None:
+    """Appends the transcriptions to the partial file every chunk_size utterances"""
+    chunk = []
+
+    def flush(f) -> None:
+        pl.DataFrame(chunk, schema=CHECKPOINT_SCHEMA, orient="row").write_csv(
+            f, include_header=f.tell() == 0
+        )
+        f.flush()
+        os.fsync(f.fileno())
+        chunk.clear()
+
+    with path.open("a", encoding="utf-8") as f:
+        try:
+            for utterance, transcription in zip(utterances, transcriptions):
+                chunk.append((utterance, transcription))
+                if pbar is not None:
+                    pbar.update(1)
+                if len(chunk) >= chunk_size:
+                    flush(f)
+        finally:
+            # Keep whatever was finished if the run is interrupted
+            if chunk:
+                flush(f)
+
+
+def finalise_results(
+    dataset: pl.DataFrame, partial_path: Path, results_path: Path
+) -> pl.DataFrame:
+    """Combines the test set with the transcriptions in the partial file and
+    atomically moves the result into place"""
+    transcriptions = read_checkpoint(partial_path)
+    results = dataset.join(
+        transcriptions, on="utterance", how="left", maintain_order="left"
+    )
+    missing = results["transcription"].null_count()
+    if missing > 0:
+        raise RuntimeError(
+            f"{missing} utterances are missing from '{partial_path}'. Rerun the test to transcribe them"
+        )
+
+    tmp_path = results_path.with_name(results_path.name + ".tmp")
+    results.write_csv(tmp_path)
+    os.replace(tmp_path, results_path)
+    partial_path.unlink()
+    return results
+
+
+# Every worker process holds one model and reuses a single recogniser for all of
+# the files it is given
+_model: Optional[Model] = None
+_recogniser: Optional[KaldiRecognizer] = None
+
+
+def _init_worker(model_path: Path, create_recogniser: bool = True) -> None:
+    global _model, _recogniser
+    if _model is None:
+        _model = Model(str(model_path))
+    if create_recogniser and _recogniser is None:
+        _recogniser = KaldiRecognizer(_model, 16_000)
+
+
+def _transcribe_worker(path: str) -> str:
+    return transcribe_file(_recogniser, path)
+
+
 def transcribe_file(recogniser: KaldiRecognizer, input_path: Path) -> str:
     assert Path(input_path).exists()
 
-    def get_text_from_result(result) -> str:
-        result = json.loads(result)
-        return result["text"]
-
-    results = []
     with wave.open(input_path) as wf:
-        while True:
-            data = wf.readframes(8000)
-            if len(data) == 0:
-                break
-            if recogniser.AcceptWaveform(data):
-                results.append(get_text_from_result(recogniser.Result()))
-
-    # Need to make sure that there is a result
-    final_result = get_text_from_result(recogniser.FinalResult())
-    if final_result:
-        results.append(final_result)
-    recogniser.Reset()
-    return " ".join(results).strip()
+        return decode(recogniser, iter(lambda: wf.readframes(CHUNK_FRAMES), b""))
 
 
 def parse_args() -> argparse.Namespace:
@@ -127,4 +291,33 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--test-data", required=True, type=Path)
     parser.add_argument("--publish", action="store_true")
     parser.add_argument("--publish_path", type=str)
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of worker processes used to transcribe the files",
+    )
+    parser.add_argument(
+        "--shard",
+        type=parse_shard,
+        help="Only test one part of the test set, given as i/N (e.g. 2/4). Use 'merge' to combine the shards afterwards",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=100,
+        help="Number of transcriptions to collect before writing them to the partial results file",
+    )
     return parser.parse_args()
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not of the form i/N")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(
+            f"The shard index must be between 1 and {count}, got {index}"
+        )
+    return index, count
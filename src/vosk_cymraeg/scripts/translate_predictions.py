@@ -1,57 +1,225 @@
 import argparse
-import polars as pl
-import datasets
+import fcntl
+import logging
+import os
+from pathlib import Path
 
+import datasets
+import polars as pl
+from rich.logging import RichHandler
 from tqdm import tqdm
-
 from transformers import pipeline
 
+_logger = logging.getLogger(__name__)
+
+# Translations are cached here so that they are only computed once per model
+CACHE_PATH = Path("data/external/cache/translations.arrow")
+
+CACHE_SCHEMA = {
+    "model": pl.String,
+    "src_lang": pl.String,
+    "tgt_lang": pl.String,
+    "source": pl.String,
+    "translation": pl.String,
+}
+
+# A translation is cached once for each of these
+CACHE_KEY = ["model", "src_lang", "tgt_lang", "source"]
+
 
 def main() -> None:
-    test_df = get_dataset("prvInSpace/evals-kaldi-full-model")
+    logging.basicConfig(
+        level="INFO", format="%(message)s", datefmt="[%X]", handlers=[RichHandler()]
+    )
+    args = parse_args()
 
-    model_name = "DewiBrynJones/nllb-200-1.3B-ft-cym-to-eng"
-    translator = pipeline("translation", model=model_name)
+    test_df = get_dataset(args.results, args.covost_data_dir)
+    key = (
+        (pl.col("model") == args.model)
+        & (pl.col("src_lang") == args.src_lang)
+        & (pl.col("tgt_lang") == args.tgt_lang)
+    )
 
-    def get_translation(text: str) -> str:
-        return translator(text, src_lang="cym_Latn", tgt_lang="eng_Latn")[0][
-            "translation_text"
-        ]
+    cache = read_cache(args.cache)
+    sources = test_df["prediction"].drop_nulls().unique(maintain_order=True)
+    missing = sources.filter(~sources.is_in(cache.filter(key)["source"].implode()))
+    _logger.info(
+        f"Found {len(sources)} unique predictions in {len(test_df)} rows. {len(sources) - len(missing)} are already in the cache"
+    )
 
-    with tqdm(total=len(test_df)) as pbar:
-        test_df = test_df.with_columns(
-            pl.col("prediction")
-            .map_elements(w_pbar(pbar, get_translation), pl.String)
-            .alias("predicted_translation")
+    if len(missing) > 0:
+        _logger.info(f"Loading '{args.model}'")
+        translator = pipeline("translation", model=args.model, device=args.device)
+        cache = translate(
+            translator,
+            missing.to_list(),
+            cache,
+            args.cache,
+            model=args.model,
+            src_lang=args.src_lang,
+            tgt_lang=args.tgt_lang,
+            batch_size=args.batch_size,
+            save_every=args.save_every,
         )
-    test_df.write_parquet("results/translation.parquet")
 
+    translations = cache.filter(key).select(
+        pl.col("source").alias("prediction"),
+        pl.col("translation").alias("predicted_translation"),
+    )
+    test_df = test_df.join(
+        translations, on="prediction", how="left", maintain_order="left"
+    )
+
+    output_path: Path = args.output
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    test_df.write_parquet(output_path)
+    _logger.info(f"Wrote the translations to '{output_path}'")
+
+
+def translate(
+    translator,
+    texts: list[str],
+    cache: pl.DataFrame,
+    cache_path: Path,
+    model: str,
+    src_lang: str,
+    tgt_lang: str,
+    batch_size: int = 16,
+    save_every: int = 10,
+) -> pl.DataFrame:
+    """Translates the texts in batches and adds them to the cache. The cache is
+    saved every few batches, and when the translation is interrupted, so that
+    a new run only has to translate what is left. Returns the cache as it is on
+    disk after the last save, including what other runs have added to it"""
+    # Sorting the texts by length puts texts of similar length into the same
+    # batch, which keeps the padding of each batch to a minimum
+    texts = sorted(texts, key=len)
+    rows: list[tuple[str, str]] = []
+
+    def save() -> pl.DataFrame:
+        nonlocal rows
+        if not rows:
+            return cache
+        new = pl.DataFrame(rows, schema=["source", "translation"], orient="row").select(
+            model=pl.lit(model),
+            src_lang=pl.lit(src_lang),
+            tgt_lang=pl.lit(tgt_lang),
+            source="source",
+            translation="translation",
+        )
+        rows = []
+        return write_cache(cache_path, new)
+
+    try:
+        with tqdm(desc="Translating", total=len(texts)) as pbar:
+            for i, start in enumerate(range(0, len(texts), batch_size)):
+                batch = texts[start : start + batch_size]
+                outputs = translator(
+                    batch,
+                    src_lang=src_lang,
+                    tgt_lang=tgt_lang,
+                    batch_size=len(batch),
+                )
+                rows.extend(
+                    zip(batch, (output["translation_text"] for output in outputs))
+                )
+                pbar.update(len(batch))
+                if (i + 1) % save_every == 0:
+                    cache = save()
+    finally:
+        cache = save()
+    return cache
+
+
+def read_cache(path: Path) -> pl.DataFrame:
+    if not path.exists():
+        return pl.DataFrame(schema=CACHE_SCHEMA)
+    return pl.read_ipc(path, memory_map=False)
+
+
+def write_cache(path: Path, new: pl.DataFrame) -> pl.DataFrame:
+    """Adds the new translations to the cache on disk and returns the result.
+    The cache is read again while holding a lock, so that the translations that
+    other runs have saved in the meantime are kept. Where a translation is
+    already cached, the cached one is kept"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(f"{path.name}.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        cache = pl.concat([read_cache(path), new]).unique(
+            CACHE_KEY, keep="first", maintain_order=True
+        )
 
-def get_dataset(path: str) -> pl.DataFrame:
-    covost_df = get_covost_df()
+        # Write to a temporary file first so that other processes never see a
+        # partially written cache
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        cache.write_ipc(tmp_path)
+        os.replace(tmp_path, path)
+    return cache
+
+
+def get_dataset(
+    path: str, covost_data_dir: Path = Path("data/raw/cv/4/cy/")
+) -> pl.DataFrame:
+    """Loads the results of the 'test' script, either from a dataset on the
+    Hugging Face Hub or from a local CSV file, together with the reference
+    translations from CoVoST 2"""
+    covost_df = get_covost_df(covost_data_dir)
+    if Path(path).is_file():
+        results = pl.read_csv(path, schema_overrides={"transcription": pl.String})
+    else:
+        results = datasets.load_dataset(path, split="test").to_polars()
     return (
-        datasets.load_dataset(path, split="test")
-        .to_polars()
-        .rename({"transcription": "prediction"})
+        results.rename({"transcription": "prediction"})
         .with_columns(pl.col("utterance").str.split("-").list.get(-1).alias("id"))
         .join(covost_df.select(["id", "translation"]), on="id", how="inner")
     )
 
 
-def get_covost_df() -> pl.DataFrame:
+def get_covost_df(data_dir: Path = Path("data/raw/cv/4/cy/")) -> pl.DataFrame:
     covost: datasets.DatasetDict = datasets.load_dataset(
-        "facebook/covost2", "cy_en", data_dir="data/raw/cv/4/cy/"
+        "facebook/covost2", "cy_en", data_dir=str(data_dir)
     )
     return pl.concat([ds.remove_columns("audio").to_polars() for ds in covost.values()])
 
 
 def parse_args() -> argparse.Namespace:
-    pass
-
+    parser = argparse.ArgumentParser(
+        "translate",
+        description="Script responsible for translating the predictions of a model to English",
+    )
+    parser.add_argument(
+        "--results",
+        default="prvInSpace/evals-kaldi-full-model",
+        help="Results of the 'test' script, given as a dataset on the Hugging Face Hub or a local CSV file",
+    )
+    parser.add_argument("--model", default="DewiBrynJones/nllb-200-1.3B-ft-cym-to-eng")
+    parser.add_argument("--src-lang", default="cym_Latn")
+    parser.add_argument("--tgt-lang", default="eng_Latn")
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=16,
+        help="Number of sentences translated at a time",
+    )
+    parser.add_argument(
+        "--save-every",
+        type=int,
+        default=10,
+        help="Number of batches between saving the cache",
+    )
+    parser.add_argument(
+        "--device",
+        help="Device to run the model on (e.g. 'cpu' or 'cuda'). Uses the default of transformers if not given",
+    )
+    parser.add_argument(
+        "--covost-data-dir", type=Path, default=Path("data/raw/cv/4/cy/")
+    )
+    parser.add_argument("--cache", type=Path, default=CACHE_PATH)
+    parser.add_argument(
+        "--output", type=Path, default=Path("results/translation.parquet")
+    )
+    return parser.parse_args()
 
-def w_pbar(pbar, func):
-    def foo(*args, **kwargs):
-        pbar.update(1)
-        return func(*args, **kwargs)
 
-    return foo
+if __name__ == "__main__":
+    main()
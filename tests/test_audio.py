@@ -0,0 +1,108 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+pytest.importorskip("sox")
+
+from vosk_cymraeg.datasets.audio import (  # noqa: E402
+    TARGET_SAMPLE_RATE,
+    SoundfileBackend,
+    SoxBackend,
+)
+
+# Largest difference between the two backends as a fraction of full scale. The
+# RMS of the difference has to stay below half of it
+TOLERANCE = 0.01
+
+# The filters only differ at the start and end of the clip, where they run into
+# the padding, so the edges are left out of the comparison
+EDGE = TARGET_SAMPLE_RATE // 100
+
+# Real MP3 clips encoded with LAME, next to what sox 14.4.2 made of each of them
+# with the same effects as SoxBackend, i.e.
+#
+#   sox -D <name>.mp3 -b 16 <name>.sox.wav channels 1 rate -h 16000
+#
+# so that the MP3 decoding can be checked without sox being installed
+DATA_PATH = Path(__file__).parent / "data"
+
+# Samples at the start of the sox output that soundfile leaves out. Clips with a
+# LAME tag, like the ones from Common Voice, are played back without the delay
+# added by the encoder (1105 samples) by soundfile, whereas sox keeps it and
+# also decodes the tag itself as a frame of silence (576 samples at 16kHz)
+MP3_CLIPS = [("tone-48k", 0), ("tone-16k-lame-tag", 576 + 1105)]
+
+requires_sox = pytest.mark.skipif(
+    shutil.which("sox") is None, reason="sox is not on PATH"
+)
+
+
+def _signal(sample_rate: int, channels: int) -> np.ndarray:
+    """Two seconds of tones well below the new Nyquist frequency plus a little
+    noise, at half of full scale"""
+    rng = np.random.default_rng(0)
+    t = np.arange(2 * sample_rate) / sample_rate
+    tones = sum(np.sin(2 * np.pi * f * t) for f in (220, 1000, 3100)) / 3
+    data = np.stack(
+        [tones * 0.5 + rng.normal(0, 0.01, len(t)) for _ in range(channels)],
+        axis=1,
+    )
+    return np.clip(data, -1, 1)
+
+
+def _convert(backend, input_path, output_path) -> np.ndarray:
+    backend.convert_file(input_path, output_path)
+    info = sf.info(output_path)
+    assert info.samplerate == TARGET_SAMPLE_RATE
+    assert info.channels == 1
+    assert info.subtype == "PCM_16"
+    return _read(output_path)
+
+
+def _read(path) -> np.ndarray:
+    data, _ = sf.read(path, dtype="int16")
+    return data.astype(np.float64) / 32768
+
+
+def _assert_agree(actual: np.ndarray, expected: np.ndarray, resampled: bool) -> None:
+    length = min(len(actual), len(expected))
+    if not resampled:
+        # Nothing is resampled, so the two may only differ in the rounding
+        np.testing.assert_allclose(actual[:length], expected[:length], atol=1 / 32768)
+    else:
+        difference = actual[EDGE : length - EDGE] - expected[EDGE : length - EDGE]
+        assert np.abs(difference).max() <= TOLERANCE
+        assert np.sqrt(np.mean(difference**2)) <= TOLERANCE / 2
+
+
+@requires_sox
+@pytest.mark.parametrize(
+    "sample_rate, channels",
+    [(16_000, 1), (22_050, 1), (44_100, 2), (48_000, 1), (48_000, 2)],
+)
+def test_soundfile_backend_matches_sox(tmp_path, sample_rate, channels):
+    input_path = tmp_path / "input.wav"
+    sf.write(input_path, _signal(sample_rate, channels), sample_rate, "PCM_16")
+
+    expected = _convert(SoxBackend(), input_path, tmp_path / "sox.wav")
+    actual = _convert(SoundfileBackend(), input_path, tmp_path / "soundfile.wav")
+
+    assert abs(len(actual) - len(expected)) <= 1
+    _assert_agree(actual, expected, sample_rate != TARGET_SAMPLE_RATE)
+
+
+@pytest.mark.parametrize("name, delay", MP3_CLIPS)
+def test_soundfile_backend_matches_sox_on_mp3(tmp_path, name, delay):
+    input_path = DATA_PATH / f"{name}.mp3"
+    actual = _convert(SoundfileBackend(), input_path, tmp_path / "soundfile.wav")
+    expected = _read(DATA_PATH / f"{name}.sox.wav")[delay:]
+
+    # sox also drops the last frame of the clip, which holds at most 576
+    # samples once it has been resampled to 16kHz
+    assert len(expected) <= len(actual) <= len(expected) + 576
+    _assert_agree(
+        actual, expected, sf.info(input_path).samplerate != TARGET_SAMPLE_RATE
+    )
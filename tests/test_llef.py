@@ -0,0 +1,185 @@
+from pathlib import Path
+
+import pytest
+
+from vosk_cymraeg.phonetics import llef_py3
+from vosk_cymraeg.phonetics.llef_py3 import (
+    CODAS,
+    ONSETS,
+    STRESSED_EXCEPTIONS,
+    UNSTRESSED_EXCEPTIONS,
+    Syllable,
+    get_stressed_phones,
+    get_unstressed_phones,
+    is_vowel_phone,
+    split_syllables,
+)
+
+BANGOR_DICT = (
+    Path(__file__).parents[1] / "data/external/geiriadur-ynganu-bangor/bangordict.dict"
+)
+
+WORDS = [
+    "helo",
+    "cymraeg",
+    "ysgrifennu",
+    "llongyfarchiadau",
+    "chwythu",
+    "gwlad",
+    "gwneud",
+    "gwrando",
+    "nghwlwm",
+    "ngwraig",
+    "cywion",
+    "miliynau",
+    "amryw",
+    "rhedeg",
+    "mhlant",
+    "ymddiheuro",
+    "sbectol",
+    "ystafell",
+    "twts",
+    "cwestiynau",
+    "iaith",
+    "iard",
+    "wythnos",
+    "diolch",
+    "caerdydd",
+    "pnawn",
+    "camp",
+    "perthynas",
+    "Nghymru",
+    "tŷ",
+    "côr",
+    "caffé",
+    "dw'n",
+    "a'r",
+    "i'w",
+    "ch'",
+    "bcd",
+    "",
+]
+
+
+def first_match_split_syllables(orig_phones, apostrophe_phone_indexes):
+    """The original implementation of split_syllables, which takes the first
+    onset and coda in ONSETS and CODAS that the remaining phones start with"""
+    phones = orig_phones[:]
+    syllables = []
+
+    offset = 0
+
+    while True:
+        if not phones:
+            break
+        found_onset = None
+        for onset in ONSETS:
+            if tuple(phones[: len(onset)]) == onset:
+                found_onset = onset
+                phones = phones[len(onset) :]
+                break
+
+        found_vowels = []
+        while phones and is_vowel_phone(phones[0]):
+            vowel = phones[0]
+            found_vowels.append(vowel)
+            phones = phones[1:]
+            if vowel != "I":
+                # Allow 'iad' etc to be one syllable
+                break
+        if not found_vowels:
+            raise ValueError(
+                "No vowels in syllable: orig_phones=%r, phones=%r"
+                % (orig_phones, phones)
+            )
+
+        found_coda = None
+        for coda in CODAS:
+            if tuple(phones[: len(coda)]) == coda:
+                found_coda = coda
+                phones = phones[len(coda) :]
+                break
+        syllable_length = (
+            len(found_onset or ()) + len(found_vowels) + len(found_coda or ())
+        )
+        precoda_length = len(found_onset or ()) + len(found_vowels)
+
+        # is_final if end of word, or if there is an apostrophe after the nucleus
+        is_final = not phones
+        for i in range(offset + precoda_length + 1, offset + syllable_length + 1):
+            if i in apostrophe_phone_indexes:
+                is_final = True
+
+        syllables.append(Syllable(found_onset, found_vowels, found_coda, is_final))
+    return tuple(syllables)
+
+
+def _outcome(function, *args):
+    """The result of the call, or the type of the exception it raised"""
+    try:
+        result = function(*args)
+    except Exception as e:
+        return type(e)
+    if isinstance(result, tuple) and all(isinstance(s, Syllable) for s in result):
+        return [(s.onset, s.vowels, s.coda, s.is_final) for s in result]
+    return result
+
+
+def _compare(words, monkeypatch):
+    new = [
+        (_outcome(get_stressed_phones, word), _outcome(get_unstressed_phones, word))
+        for word in words
+    ]
+    with monkeypatch.context() as m:
+        m.setattr(llef_py3, "split_syllables", first_match_split_syllables)
+        old = [
+            (_outcome(get_stressed_phones, word), _outcome(get_unstressed_phones, word))
+            for word in words
+        ]
+    mismatches = [
+        (word, o, n) for word, o, n in zip(words, old, new, strict=True) if o != n
+    ]
+    assert not mismatches
+
+
+@pytest.mark.parametrize("clusters", [ONSETS, CODAS], ids=["onsets", "codas"])
+def test_clusters_come_before_their_prefixes(clusters):
+    # The longest match only gives the same result as the first match as long
+    # as no cluster is a prefix of a longer cluster further down the table
+    for i, cluster in enumerate(clusters):
+        for later in clusters[i + 1 :]:
+            assert not (
+                len(later) > len(cluster) and later[: len(cluster)] == cluster
+            ), f"{cluster} comes before {later}"
+
+
+def test_split_syllables_matches_first_match_on_every_cluster():
+    # Every cluster before and after a vowel, followed by every other cluster,
+    # so that every entry of both tables is matched against every continuation
+    clusters = sorted(set(ONSETS) | set(CODAS))
+    for onset in clusters:
+        for coda in clusters:
+            for phones, apostrophes in (
+                ([*onset, "A", *coda], {len(onset) + 1}),
+                ([*onset, "I", "A", *coda, *onset, "O"], set()),
+            ):
+                assert _outcome(split_syllables, phones, apostrophes) == _outcome(
+                    first_match_split_syllables, phones, apostrophes
+                ), phones
+
+
+def test_matches_first_match_on_sample_words(monkeypatch):
+    _compare(
+        [*WORDS, *STRESSED_EXCEPTIONS, *UNSTRESSED_EXCEPTIONS],
+        monkeypatch,
+    )
+
+
+@pytest.mark.skipif(
+    not BANGOR_DICT.exists(),
+    reason="Geiriadur Ynganu Bangor is not checked out",
+)
+def test_matches_first_match_on_bangor_words(monkeypatch):
+    with open(BANGOR_DICT, encoding="utf-8") as f:
+        words = list(dict.fromkeys(line.split(" ", 1)[0] for line in f if line.strip()))
+    _compare(words, monkeypatch)
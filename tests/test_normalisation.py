@@ -0,0 +1,56 @@
+import polars as pl
+import pytest
+
+from vosk_cymraeg.normalisation import normalise_expr, normalise_sentence
+
+SENTENCES = [
+    "Mae hi'n braf heddiw.",
+    "  Bore   da,\tbawb!  ",
+    # Curly quotes and apostrophes
+    "Dw i’n mynd i’r dre’ — “heddiw”…",
+    "‘Sut wyt ti?’ gofynnodd hi",
+    # Multi-character sequences handled by the replacements
+    "Wel... [anadl] ym {aneglur} ''sai'n gwbod''",
+    "<chwerthin) a/neu {chwerthin} *pwyslais*",
+    "<anadlu i mewn yn sydyn> a <clirio gwddf> wedyn <chwythu allan>",
+    # Precomposed and combining diacritics
+    "Dŵr, tŷ, côr, ffôn a chân",
+    "Dw\u0302r, ty\u0302, co\u0302r a cha\u0302n",
+    "Caffe\u0301 nai\u0308ve",
+    # Dashes and unusual whitespace
+    "un–dau—tri¬pedwar",
+    "un\u00a0dau\u2009tri\u200bpedwar\u3000pump\x1cchwech",
+    "ENGLISH and Cymraeg: 1, 2, 3",
+    "",
+    "   ",
+    "...",
+]
+
+
+@pytest.mark.parametrize("sentence", SENTENCES)
+def test_normalise_expr_matches_normalise_sentence(sentence: str):
+    result = pl.select(normalise_expr(pl.lit(sentence, dtype=pl.String))).item()
+    assert result == normalise_sentence(sentence)
+
+
+def test_normalise_expr_matches_on_a_whole_column():
+    # All of the sentences in one batch, so that the characters of one sentence
+    # end up in the same substitution table as the others
+    df = pl.DataFrame({"sentence": SENTENCES})
+    assert df.select(normalise_expr("sentence"))["sentence"].to_list() == [
+        normalise_sentence(sentence) for sentence in SENTENCES
+    ]
+
+
+def test_normalise_expr_keeps_nulls():
+    df = pl.DataFrame({"sentence": [None, "", "Helo!"]}, schema={"sentence": pl.String})
+    assert df.select(normalise_expr("sentence"))["sentence"].to_list() == [
+        None,
+        "",
+        normalise_sentence("Helo!"),
+    ]
+
+
+def test_normalise_expr_on_an_empty_column():
+    df = pl.DataFrame({"sentence": []}, schema={"sentence": pl.String})
+    assert df.select(normalise_expr("sentence")).height == 0
@@ -0,0 +1,39 @@
+import pytest
+
+from vosk_cymraeg.phonetics.phone_mapping import (
+    load_phone_mapping,
+    read_checksum,
+    write_phone_mapping,
+)
+
+MAPPING = (
+    "llef\tBangor\tGeriadur-ynganu-bangor equivalent\tNotes\nA\ta\ta\t\nLL\tɬ\tɬ\t\n"
+)
+
+
+def test_write_then_load(tmp_path):
+    path = tmp_path / "mapping.tsv"
+    digest = write_phone_mapping(MAPPING, path)
+
+    assert read_checksum(path) == digest
+    assert load_phone_mapping(path) == {"A": "a", "LL": "ɬ"}
+    # Only the snapshot and its checksum are left behind
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "mapping.tsv",
+        "mapping.tsv.sha256",
+    ]
+
+
+def test_missing_snapshot_is_not_downloaded(tmp_path):
+    with pytest.raises(FileNotFoundError, match="uv run refresh"):
+        load_phone_mapping(tmp_path / "mapping.tsv")
+    assert not any(tmp_path.iterdir())
+
+
+def test_modified_snapshot_is_rejected(tmp_path):
+    path = tmp_path / "mapping.tsv"
+    write_phone_mapping(MAPPING, path)
+    path.write_text(MAPPING.replace("ɬ", "l"), encoding="utf-8")
+
+    with pytest.raises(ValueError, match="uv run refresh"):
+        load_phone_mapping(path)
@@ -0,0 +1,43 @@
+import re
+
+import pytest
+
+from vosk_cymraeg.phonetics.dictionary import load_dictionary
+from vosk_cymraeg.phonetics.phonemizer import _lookup, _lookup_many
+
+PATTERN = re.compile("([^ ]+) (.+) (/.*/)")
+
+LINES = [
+    "tŷ t ɨː /tɨː/",
+    "helo h ɛ l ɔ /hɛlɔ/",
+    "a a /a/",
+    "helo h e l o /helo/",
+    "ŵy uː ɨ /uːɨ/",
+    "cymraeg k ə m r a i g /kəmraɨɡ/",
+    "Cymraeg k ə m r a i g /kəmraɨɡ/",
+    "helo h ɛ l o /hɛlo/",
+]
+
+
+@pytest.fixture
+def table(tmp_path):
+    path = tmp_path / "test.dict"
+    path.write_text("\n".join(LINES) + "\n")
+    return load_dictionary(path, PATTERN, cache_path=tmp_path / "cache")
+
+
+def test_lookup_matches_lookup_many(table):
+    words = ["helo", "tŷ", "ŵy", "a", "Cymraeg", "cymraeg", "hello", "", "zzz"]
+    expected = {
+        word: pronunciations or []
+        for word, pronunciations in _lookup_many(table, words).iter_rows()
+    }
+    assert {word: _lookup(table, word) for word in words} == expected
+
+
+def test_lookup_keeps_the_order_of_the_pronunciations(table):
+    assert _lookup(table, "helo") == [
+        ["h", "ɛ", "l", "ɔ"],
+        ["h", "e", "l", "o"],
+        ["h", "ɛ", "l", "o"],
+    ]